@@ -0,0 +1,380 @@
+# レイアウト・色計算・描画のベンチマーク。Tk の画面がなくても動く
+#   python bench.py                       偽キャンバスで 100 / 1k / 10k / 100k 件
+#   xvfb-run python bench.py --tk         本物の Tk キャンバス（仮想ディスプレイ上）
+#   python bench.py --json after.json --compare before.json
+#   xvfb-run python bench.py --startup    起動（import・最初の描画）と編集画面などを開く時間
+import argparse
+import datetime
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import fade
+from blink import BlinkService
+from layout import TreemapLayout
+from raster import RENDERERS
+from renderer import OUTPUT_STYLE
+from store import Task, TaskStore
+
+SIZES = (100, 1000, 10000, 100000)
+STARTUP_RUNS = 10  # 起動は毎回別のプロセスで測る（import のキャッシュが効かないように）
+CATEGORIES = ["医学", "研究", "事務", "個人", "買い物", "読書", "運動", "その他"]
+WIDTH, HEIGHT = 1920, 1080
+
+
+class FakeCanvas:
+    # TaskCanvasRenderer が使う Canvas のメソッドだけを持つ。呼ばれた回数と生きているアイテム数を数える
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.items = set()
+        self.counts = {"create": 0, "delete": 0, "coords": 0, "itemconfig": 0, "put": 0}
+
+    def _create(self, *args, **kwargs):
+        self.counts["create"] += 1
+        item = next(self._ids)
+        self.items.add(item)
+        return item
+
+    create_rectangle = _create
+    create_text = _create
+    create_image = _create
+
+    def cget(self, option):
+        return "white"
+
+    def delete(self, item):
+        self.counts["delete"] += 1
+        self.items.discard(item)
+
+    def coords(self, item, *args):
+        self.counts["coords"] += 1
+
+    def itemconfig(self, item, **kwargs):
+        self.counts["itemconfig"] += 1
+
+    def addtag_withtag(self, tag, item):
+        self.counts["itemconfig"] += 1
+
+    def dtag(self, item, tag):
+        self.counts["itemconfig"] += 1
+
+    def after(self, ms, func, *args):
+        return None
+
+    def after_idle(self, func, *args):
+        return None
+
+    def after_cancel(self, after_id):
+        pass
+
+    def item_count(self):
+        return len(self.items)
+
+
+class FakeImage:
+    # RasterTaskRenderer の PhotoImage の代わり。塗った回数だけ数える
+    def __init__(self, counts):
+        self.counts = counts
+
+    def put(self, data, to=None):
+        self.counts["put"] += 1
+
+
+class FakeMetrics:
+    # 1文字 = フォントサイズ分の幅とみなす
+    def dpi_scale(self):
+        return 1.0
+
+    def linespace(self, spec):
+        return int(spec[1] * 1.5)
+
+    def fit(self, spec, text, max_width):
+        n = max_width // spec[1]
+        if len(text) <= n:
+            return text
+        return text[:n - 1] + "…" if n > 1 else ""
+
+
+class BenchApp:
+    # TaskCanvasRenderer から見える TaskApp の部分だけ
+    def __init__(self, tasks, widget):
+        self.tasks = tasks
+        self.categories = CATEGORIES
+        self.category_colors = fade.category_colors(CATEGORIES)
+        self.category_palettes = {cat: fade.build_palette(c) for cat, c in self.category_colors.items()}
+        self.blink = BlinkService(widget)
+
+
+def make_tasks(n, seed=0):
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+    tasks = []
+    for i in range(1, n + 1):
+        created = now - datetime.timedelta(hours=rng.uniform(0, 24 * 14))
+        due = "none" if rng.random() < 0.1 else \
+            (now + datetime.timedelta(hours=rng.uniform(-24, 24 * 14))).strftime("%Y-%m-%d %H:%M:00")
+        tasks.append(Task(i, f"タスク {i}", f"詳細 {i}", rng.choice(CATEGORIES), due,
+                          rng.randint(1, 10), created.isoformat()))
+    return tasks
+
+
+def summarize(samples):
+    samples = sorted(samples)
+
+    def pct(q):
+        return samples[min(int(q * len(samples)), len(samples) - 1)] * 1000
+
+    return {"p50": pct(0.5), "p90": pct(0.9), "p99": pct(0.99), "max": samples[-1] * 1000,
+            "mean": statistics.fmean(samples) * 1000}
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def bench_layout(n, repeat):
+    store = TaskStore(make_tasks(n))
+    results = {}
+
+    def cold():
+        TreemapLayout().layout(store, CATEGORIES, WIDTH, HEIGHT)
+
+    results["layout.cold"] = timed(cold, repeat)
+    layout = TreemapLayout()
+    layout.layout(store, CATEGORIES, WIDTH, HEIGHT)
+    results["layout.cached"] = timed(lambda: layout.layout(store, CATEGORIES, WIDTH, HEIGHT), repeat)
+
+    rng = random.Random(1)
+    tasks = list(store)
+
+    def one_edit():
+        store.update(rng.choice(tasks), importance=rng.randint(1, 10))
+        layout.layout(store, CATEGORIES, WIDTH, HEIGHT)
+
+    results["layout.one_edit"] = timed(one_edit, repeat)
+    return results
+
+
+def bench_fade(n, repeat):
+    # 全タスクの色を毎回求めた場合（以前の毎秒の処理に相当）
+    tasks = make_tasks(n)
+    palettes = {cat: fade.build_palette(c) for cat, c in fade.category_colors(CATEGORIES).items()}
+
+    def all_tasks():
+        now = time.time()
+        for task in tasks:
+            step, _ = fade.fade_state(task.created_ts, task.due_ts, now)
+            if step is not None and step >= 0:
+                palettes[task.category][step]
+
+    return {"fade.all_tasks": timed(all_tasks, repeat)}
+
+
+def bench_render(n, repeat, use_tk, backend="vector"):
+    renderer_class = RENDERERS[backend]
+    options = {}
+    if use_tk:
+        import tkinter as tk
+        root = tk.Tk()
+        canvas = tk.Canvas(root, width=WIDTH, height=HEIGHT)
+        canvas.pack()
+        metrics = None
+
+        def settle():
+            canvas.update_idletasks()
+
+        def item_count():
+            return len(canvas.find_all())
+    else:
+        root = None
+        canvas = FakeCanvas()
+        metrics = FakeMetrics()
+        if backend == "raster":
+            options["image"] = FakeImage(canvas.counts)
+
+        def settle():
+            pass
+
+        item_count = canvas.item_count
+
+    store = TaskStore()
+    app = BenchApp(store, canvas)
+    results = {}
+
+    def make_renderer():
+        renderer = renderer_class(canvas, app, OUTPUT_STYLE, WIDTH, HEIGHT, metrics=metrics, **options)
+        clock = [time.time()]
+        renderer.clock = lambda: clock[0]
+        return renderer, clock
+
+    # 空の状態から全件を描く（起動時・全面描き直しに相当）
+    tasks = make_tasks(n)
+    cold = []
+    for _ in range(max(1, repeat // 5)):
+        store.clear()
+        renderer, _ = make_renderer()
+        store.load(tasks)
+        start = time.perf_counter()
+        renderer.relayout()
+        settle()
+        cold.append(time.perf_counter() - start)
+        renderer.clear()
+        renderer.close()
+        settle()
+    results["render.cold"] = summarize(cold)
+
+    store.clear()
+    renderer, clock = make_renderer()
+    store.load(tasks)
+    renderer.relayout()
+    settle()
+    results["render.items"] = item_count()
+
+    # 1件だけ重要度を変えたあとの差分描画
+    rng = random.Random(2)
+
+    def one_edit():
+        store.update(rng.choice(tasks), importance=rng.randint(1, 10))
+        renderer.relayout()
+        settle()
+
+    results["render.one_edit"] = timed(one_edit, repeat)
+
+    # 時計を1秒ずつ進めたときの色の更新（以前は毎秒の全面描き直し）
+    def tick():
+        clock[0] += 1
+        renderer._wakeups.run_due()
+        settle()
+
+    results["render.tick"] = timed(tick, repeat)
+    results["render.items_after"] = item_count()
+
+    # 出力ウィンドウの集計表示（カテゴリごとに1ブロック）
+    renderer.set_summary(True)
+    settle()
+    results["render.summary_items"] = item_count()
+    results["render.summary_edit"] = timed(one_edit, repeat)
+    renderer.close()
+    if root is not None:
+        root.destroy()
+    return results
+
+
+def startup_probe(spawned):
+    # --startup の子プロセス。空の tasks.db（カレントディレクトリ）で1回起動して、各時間（秒）を JSON で出す
+    start = time.perf_counter()
+    import tkinter as tk
+    import main as app_main
+    imported = time.perf_counter()
+    root = tk.Tk()
+    app = app_main.TaskApp(root)  # 普段の起動と同じ lazy_load
+    constructed = time.perf_counter()
+    results = {"startup.process": time.time() - spawned, "startup.import": imported - start,
+               "startup.construct": constructed - start}
+    # 最初の描画のあとに回したもの（日付欄の tkcalendar・タスクの読み込みなど）
+    while not {"first_paint", "loaded"} <= app.startup_stats.keys():
+        root.update()
+    root.update()
+    results["startup.deferred"] = time.perf_counter() - constructed
+    # TaskApp 自身が測った時間（Tk を作ったあとから）
+    results.update({f"startup.app_{name}": value for name, value in app.startup_stats.items()})
+
+    task = Task(1, "タスク", "詳細", app.categories[0], "2030-01-01 12:00:00", 1, datetime.datetime.now().isoformat())
+    app.tasks.add(task)
+    for name, open_dialog, dialog in (("dialog.edit", app._open_edit_dialog, lambda: app.edit_dialog),
+                                      ("dialog.due", app._open_due_dialog, lambda: app.due_dialog)):
+        for label in ("first", "reuse"):
+            t = time.perf_counter()
+            open_dialog(task)
+            root.update()
+            results[f"{name}.{label}"] = time.perf_counter() - t
+            dialog().hide()
+    t = time.perf_counter()
+    app.open_output_window()
+    root.update()
+    results["output.open"] = time.perf_counter() - t
+    app._on_exit()
+    print(json.dumps(results))
+
+
+def bench_startup(runs):
+    samples = {}
+    script = os.path.abspath(__file__)
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as cwd:
+            spawned = time.time()
+            proc = subprocess.run([sys.executable, script, "--startup-probe", str(spawned)], cwd=cwd,
+                                  capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise SystemExit(f"起動の計測に失敗しました（画面と tkcalendar が必要です）\n{proc.stderr[-2000:]}")
+        for name, value in json.loads(proc.stdout.splitlines()[-1]).items():
+            samples.setdefault(name, []).append(value)
+    return {"startup": {name: summarize(values) for name, values in samples.items()}}
+
+
+def run(sizes, use_tk, backend="vector"):
+    report = {}
+    for n in sizes:
+        repeat = max(5, min(50, 200000 // n))
+        results = {}
+        results.update(bench_layout(n, repeat))
+        results.update(bench_fade(n, repeat))
+        results.update(bench_render(n, repeat, use_tk, backend))
+        report[str(n)] = results
+    return report
+
+
+def print_report(report, baseline=None):
+    for n, results in report.items():
+        print(f"--- {n} tasks")
+        for name, value in results.items():
+            if isinstance(value, dict):
+                line = f"  {name:<20} " + "  ".join(f"{k}={v:8.2f}ms" for k, v in value.items())
+                old = (baseline or {}).get(n, {}).get(name)
+                if isinstance(old, dict) and old.get("p50"):
+                    line += f"  (p50 x{value['p50'] / old['p50']:.2f})"
+            else:
+                line = f"  {name:<20} {value}"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="レイアウト・色計算・描画のベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--tk", action="store_true", help="本物の Tk キャンバスで測る（Xvfb などの画面が必要）")
+    parser.add_argument("--backend", choices=sorted(RENDERERS), default="vector",
+                        help="描画方式。raster はタイルを1枚の画像に塗る（出力ウィンドウの --output-backend と同じ）")
+    parser.add_argument("--startup", action="store_true",
+                        help="main.py の起動と画面を開く時間を測る（Tk の画面と tkcalendar が必要）")
+    parser.add_argument("--startup-probe", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="結果を JSON で保存する")
+    parser.add_argument("--compare", help="以前に --json で保存した結果と p50 を比べる")
+    args = parser.parse_args()
+
+    if args.startup_probe is not None:
+        startup_probe(args.startup_probe)
+        return
+    report = bench_startup(STARTUP_RUNS) if args.startup else run(args.sizes, args.tk, args.backend)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import tkinter as tk
+
+from profiler import PROFILER
+
+BLINK_TAG = "overdue"
+BLINK_COLOR = "#ff0000"
+
+
+class BlinkService:
+    # 全ウィンドウで共有する点滅タイマー。描画側（renderer）は set_blink(fill) で
+    # 期限切れの矩形をまとめて切り替える（キャンバスなら BLINK_TAG への itemconfig 1回）
+    def __init__(self, widget, interval=500):
+        self.widget = widget
+        self.interval = interval
+        self.overdue = {}  # 描画側 -> 今期限切れのタスクID。同じタスクを複数の画面が持つので描画側ごとに分ける
+        self.targets = []
+        self.state = True
+        self._after_id = None
+
+    @property
+    def fill(self):
+        return BLINK_COLOR if self.state else ""
+
+    def subscribe(self, target):
+        if target not in self.targets:
+            self.targets.append(target)
+
+    def unsubscribe(self, target):
+        if target in self.targets:
+            self.targets.remove(target)
+
+    def set_overdue(self, owner, task_id, overdue):
+        if overdue:
+            self.overdue.setdefault(owner, set()).add(task_id)
+        else:
+            ids = self.overdue.get(owner)
+            if ids is not None:
+                ids.discard(task_id)
+                if not ids:
+                    del self.overdue[owner]
+        if self.overdue and self._after_id is None:
+            self._after_id = self.widget.after(self.interval, self._tick)
+
+    def release(self, owner):
+        # 描画側を閉じるときに、その画面の期限切れをまとめて外す
+        self.overdue.pop(owner, None)
+
+    @PROFILER.profiled("blink.tick", frame=True)
+    def _tick(self):
+        self._after_id = None
+        if not self.overdue:
+            return  # どの画面にも期限切れがなければ止まる。set_overdue で再開
+        self.state = not self.state
+        for target in list(self.targets):
+            try:
+                target.set_blink(self.fill)
+            except tk.TclError:
+                self.unsubscribe(target)
+        self._after_id = self.widget.after(self.interval, self._tick)
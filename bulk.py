@@ -0,0 +1,195 @@
+# タスクの一括インポート・エクスポート。Tk は起動しないので、アプリを閉じた状態で実行すること
+#   python bulk.py import backlog.csv          CSV / JSONL を tasks.db に取り込む
+#   python bulk.py export tasks.jsonl          tasks.db の中身を書き出す
+# 列（キー）は name, detail, category, due, importance, created_at, remind_minutes。due は "YYYY-MM-DD HH:MM:SS" か none、
+# remind_minutes（期限の何分前に知らせるか）は空でもよい
+import argparse
+import csv
+import datetime
+import itertools
+import json
+import sys
+import time
+
+import db
+from recurrence import parse_remind
+from store import CATEGORIES_PATH, InvalidTask, load_categories, save_categories, validate_task
+
+BATCH_SIZE = 10000    # 1トランザクションで入れる行数
+MAX_ERROR_LINES = 20  # 表示する不正行の数（件数は全部数える）
+FIELDS = ["id", "name", "detail", "category", "due", "importance", "created_at", "remind_minutes"]
+
+
+def guess_format(path, fmt=None):
+    if fmt:
+        return fmt
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    raise SystemExit(f"{path}: 形式がわからないので --format csv か --format jsonl を指定してください")
+
+
+def open_text(path, mode):
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    # Excel の「CSV UTF-8」は先頭に BOM を付けるので、読むときは utf-8-sig で外す（最初の列名が name にならない）
+    return open(path, mode, encoding="utf-8-sig" if mode == "r" else "utf-8", newline="")
+
+
+def read_rows(f, fmt):
+    # (行番号, dict) を1行ずつ返す。ファイル全体はメモリに載せない
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, InvalidTask(f"JSON として読めません: {e}")
+            continue
+        if not isinstance(row, dict):
+            row = InvalidTask("1行に1つのオブジェクトを書いてください。")
+        yield line_no, row
+
+
+def _text(row, key):
+    value = row.get(key)
+    return "" if value is None else str(value).strip()
+
+
+def to_task_row(row, default_category, now):
+    # add_task と同じ規則で確かめて INSERT の引数にする
+    if isinstance(row, InvalidTask):
+        raise row
+    due = _text(row, "due") or _text(row, "due_date") or "none"
+    name, importance, due = validate_task(_text(row, "name"), _text(row, "importance"), due)
+    category = _text(row, "category") or default_category
+    created_at = _text(row, "created_at") or now
+    remind = parse_remind(_text(row, "remind_minutes"))
+    return name, _text(row, "detail"), category, due, importance, created_at, remind
+
+
+def import_tasks(args):
+    fmt = guess_format(args.path, args.format)
+    categories = load_categories(args.categories)
+    known = set(categories)
+    new_categories = []
+    now = datetime.datetime.now().isoformat()
+    stats = {"rows": 0, "imported": 0, "invalid": 0}
+
+    def valid_rows(f):
+        for line_no, row in read_rows(f, fmt):
+            stats["rows"] += 1
+            try:
+                values = to_task_row(row, categories[0], now)
+            except InvalidTask as e:
+                stats["invalid"] += 1
+                if stats["invalid"] <= MAX_ERROR_LINES:
+                    print(f"{args.path}:{line_no}: {e}", file=sys.stderr)
+                continue
+            if values[2] not in known:
+                known.add(values[2])
+                new_categories.append(values[2])
+            yield values
+
+    conn = db.connect(args.db)
+    db.migrate(conn)
+    start = time.perf_counter()
+    with open_text(args.path, "r") as f:
+        rows = valid_rows(f)
+        while True:
+            batch = list(itertools.islice(rows, args.batch_size))
+            if not batch:
+                break
+            if not args.dry_run:
+                with conn:
+                    conn.executemany(db.insert_sql(), batch)
+            stats["imported"] += len(batch)
+            report(stats["imported"], start, "件を確認" if args.dry_run else "件を取り込み", final=False)
+    conn.close()
+
+    report(stats["imported"], start, "件を確認" if args.dry_run else "件を取り込み")
+    if stats["invalid"]:
+        print(f"不正な行 {stats['invalid']}件（{stats['rows']}行中）は飛ばしました", file=sys.stderr)
+    if new_categories and not args.dry_run:
+        # 知らないカテゴリはカテゴリ一覧にも足して、画面に出るようにする
+        save_categories(categories + new_categories, args.categories)
+        print(f"カテゴリを追加しました: {', '.join(new_categories)}")
+    return 1 if stats["invalid"] else 0
+
+
+def export_tasks(args):
+    fmt = guess_format(args.path, args.format)
+    conn = db.connect(args.db)
+    db.migrate(conn)
+    # active は tasks、完了・期限切れは archived_tasks にある
+    if args.status == "active":
+        sql, params = f"SELECT {db.TASK_COLUMNS} FROM tasks ORDER BY id", ()
+    elif args.status == "all":
+        sql, params = (f"SELECT {db.TASK_COLUMNS} FROM tasks UNION ALL "
+                       f"SELECT {db.TASK_COLUMNS} FROM archived_tasks ORDER BY id"), ()
+    else:
+        sql, params = f"SELECT {db.TASK_COLUMNS} FROM archived_tasks WHERE status=? ORDER BY id", (args.status,)
+    cursor = conn.execute(sql, params)
+    start = time.perf_counter()
+    count = 0
+    with open_text(args.path, "w") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer:
+            writer.writerow(FIELDS)
+        while True:
+            rows = cursor.fetchmany(args.batch_size)
+            if not rows:
+                break
+            for row in rows:
+                if writer:
+                    writer.writerow(row)
+                else:
+                    f.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + "\n")
+            count += len(rows)
+    conn.close()
+    report(count, start, "件を書き出し", out=sys.stderr if args.path == "-" else sys.stdout)
+    return 0
+
+
+def report(count, start, action, final=True, out=sys.stdout):
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    line = f"{count}{action}  {elapsed:.2f}秒  {count / elapsed:,.0f} 行/秒"
+    if final:
+        print(line, file=out)
+    elif out.isatty():
+        print(line, end="\r", file=out, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="タスクの一括インポート・エクスポート（CSV / JSONL）")
+    parser.add_argument("--db", default=db.DB_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import", help="CSV / JSONL からタスクを取り込む")
+    p.add_argument("path", help="入力ファイル（- なら標準入力）")
+    p.add_argument("--format", choices=["csv", "jsonl"], help="拡張子から決まらないとき")
+    p.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="1トランザクションの行数")
+    p.add_argument("--categories", default=CATEGORIES_PATH, help="知らないカテゴリを足すカテゴリ一覧")
+    p.add_argument("--dry-run", action="store_true", help="検証だけして書き込まない")
+    p.set_defaults(func=import_tasks)
+
+    p = sub.add_parser("export", help="タスクを CSV / JSONL に書き出す")
+    p.add_argument("path", help="出力ファイル（- なら標準出力）")
+    p.add_argument("--format", choices=["csv", "jsonl"], help="拡張子から決まらないとき")
+    p.add_argument("--status", default="active", choices=["active", db.COMPLETED, db.EXPIRED, "all"])
+    p.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="1回に読む行数")
+    p.set_defaults(func=export_tasks)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+import datetime
+import sqlite3
+
+from profiler import PROFILER
+
+DB_PATH = "tasks.db"
+
+# tasks_fts とそれを tasks に合わせるトリガー（migration 5）
+FTS_STATEMENTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5("
+    "name, detail, content='tasks', content_rowid='id', tokenize='trigram')",
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts (rowid, name, detail) VALUES (NEW.id, NEW.name, NEW.detail);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, name, detail) VALUES ('delete', OLD.id, OLD.name, OLD.detail);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF name, detail ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, name, detail) VALUES ('delete', OLD.id, OLD.name, OLD.detail);
+        INSERT INTO tasks_fts (rowid, name, detail) VALUES (NEW.id, NEW.name, NEW.detail);
+    END
+    """,
+    "INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')",
+]
+
+
+def fts_supported(conn):
+    # FTS5 の trigram（SQLite 3.34 から）が使えるか。一時テーブルを作ってみて確かめる
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts_probe USING fts5(x, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return False
+    conn.execute("DROP TABLE temp.fts_probe")
+    return True
+
+
+def _create_fts(conn):
+    if fts_supported(conn):
+        for sql in FTS_STATEMENTS:
+            conn.execute(sql)
+
+
+# 1要素 = 1バージョン。追加するときは末尾に足していく（既存のものは書き換えない）。
+# 要素は SQL 文か、環境によって作るものを変えるときは conn を受け取る関数
+MIGRATIONS = [
+    # 1: 元からある tasks テーブル
+    [
+        """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            detail TEXT,
+            category TEXT,
+            due_date TEXT,
+            importance INTEGER,
+            created_at TEXT
+        )
+        """,
+    ],
+    # 2: 期限・カテゴリで引くためのインデックス
+    [
+        "CREATE INDEX IF NOT EXISTS idx_tasks_due_date ON tasks(due_date)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_category ON tasks(category)",
+    ],
+    # 3: 状態（active / completed / archived）。起動時に読むのは active だけ
+    [
+        "ALTER TABLE tasks ADD COLUMN status TEXT NOT NULL DEFAULT 'active'",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, id)",
+    ],
+    # 4: 完了・期限切れのタスクは archived_tasks に移し、tasks には active だけを残す。
+    #    status を active 以外に UPDATE するとトリガーが1文の中で行を移す
+    [
+        """
+        CREATE TABLE IF NOT EXISTS archived_tasks (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            detail TEXT,
+            category TEXT,
+            due_date TEXT,
+            importance INTEGER,
+            created_at TEXT,
+            status TEXT NOT NULL,
+            archived_at TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_archived_at ON archived_tasks(archived_at)",
+        "CREATE INDEX IF NOT EXISTS idx_archived_category ON archived_tasks(category, archived_at)",
+        """
+        CREATE TRIGGER IF NOT EXISTS tasks_archive AFTER UPDATE OF status ON tasks
+        WHEN NEW.status != 'active'
+        BEGIN
+            INSERT OR REPLACE INTO archived_tasks
+                (id, name, detail, category, due_date, importance, created_at, status, archived_at)
+            VALUES (NEW.id, NEW.name, NEW.detail, NEW.category, NEW.due_date, NEW.importance, NEW.created_at,
+                    NEW.status, strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'));
+            DELETE FROM tasks WHERE id = NEW.id;
+        END
+        """,
+        """
+        INSERT OR REPLACE INTO archived_tasks (id, name, detail, category, due_date, importance, created_at, status,
+                                               archived_at)
+        SELECT id, name, detail, category, due_date, importance, created_at, status,
+               strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')
+        FROM tasks WHERE status != 'active'
+        """,
+        "DELETE FROM tasks WHERE status != 'active'",
+    ],
+    # 5: name / detail の全文検索。trigram なので日本語でも3文字以上の部分一致が索引で引ける。
+    #    中身は tasks を参照するだけで、トリガーで同期する（archived_tasks に移ったものは消える）。
+    #    trigram は SQLite 3.34 から。使えなければ作らず、search() は LIKE だけで探す
+    [
+        _create_fts,
+        "CREATE INDEX IF NOT EXISTS idx_tasks_category_importance ON tasks(category, importance)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_importance ON tasks(importance)",
+    ],
+    # 6: 同期サーバー用の変更履歴。tasks への書き込みは誰がしてもトリガーで版番号つきで残る。
+    #    data は TASK_COLUMNS 順の JSON 配列（delete のときは NULL）
+    [
+        """
+        CREATE TABLE IF NOT EXISTS changelog (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            data TEXT
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS changelog_insert AFTER INSERT ON tasks WHEN NEW.status = 'active' BEGIN
+            INSERT INTO changelog (task_id, op, data) VALUES (NEW.id, 'upsert', json_array(
+                NEW.id, NEW.name, NEW.detail, NEW.category, NEW.due_date, NEW.importance, NEW.created_at));
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS changelog_update AFTER UPDATE ON tasks WHEN NEW.status = 'active' BEGIN
+            INSERT INTO changelog (task_id, op, data) VALUES (NEW.id, 'upsert', json_array(
+                NEW.id, NEW.name, NEW.detail, NEW.category, NEW.due_date, NEW.importance, NEW.created_at));
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS changelog_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO changelog (task_id, op) VALUES (OLD.id, 'delete');
+        END
+        """,
+    ],
+    # 7: 繰り返しタスクと期限前の通知。remind_minutes は期限の何分前に知らせるか（NULL なら知らせない）。
+    #    繰り返しの回は recurrence_id つきで tasks に作り、同じ回を2度作らないよう一意にする。
+    #    archived_tasks への移動と changelog の行にも remind_minutes を足す
+    [
+        "ALTER TABLE tasks ADD COLUMN remind_minutes INTEGER",
+        "ALTER TABLE tasks ADD COLUMN recurrence_id INTEGER",
+        "ALTER TABLE archived_tasks ADD COLUMN remind_minutes INTEGER",
+        "ALTER TABLE archived_tasks ADD COLUMN recurrence_id INTEGER",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_occurrence ON tasks(recurrence_id, due_date) "
+        "WHERE recurrence_id IS NOT NULL",
+        """
+        CREATE TABLE IF NOT EXISTS recurrences (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            detail TEXT,
+            category TEXT,
+            importance INTEGER,
+            rule TEXT NOT NULL,
+            remind_minutes INTEGER,
+            last_at TEXT,
+            next_at TEXT
+        )
+        """,
+        "DROP TRIGGER IF EXISTS tasks_archive",
+        """
+        CREATE TRIGGER tasks_archive AFTER UPDATE OF status ON tasks
+        WHEN NEW.status != 'active'
+        BEGIN
+            INSERT OR REPLACE INTO archived_tasks
+                (id, name, detail, category, due_date, importance, created_at, remind_minutes, recurrence_id,
+                 status, archived_at)
+            VALUES (NEW.id, NEW.name, NEW.detail, NEW.category, NEW.due_date, NEW.importance, NEW.created_at,
+                    NEW.remind_minutes, NEW.recurrence_id, NEW.status,
+                    strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'));
+            DELETE FROM tasks WHERE id = NEW.id;
+        END
+        """,
+        "DROP TRIGGER IF EXISTS changelog_insert",
+        "DROP TRIGGER IF EXISTS changelog_update",
+        """
+        CREATE TRIGGER changelog_insert AFTER INSERT ON tasks WHEN NEW.status = 'active' BEGIN
+            INSERT INTO changelog (task_id, op, data) VALUES (NEW.id, 'upsert', json_array(
+                NEW.id, NEW.name, NEW.detail, NEW.category, NEW.due_date, NEW.importance, NEW.created_at,
+                NEW.remind_minutes));
+        END
+        """,
+        """
+        CREATE TRIGGER changelog_update AFTER UPDATE ON tasks WHEN NEW.status = 'active' BEGIN
+            INSERT INTO changelog (task_id, op, data) VALUES (NEW.id, 'upsert', json_array(
+                NEW.id, NEW.name, NEW.detail, NEW.category, NEW.due_date, NEW.importance, NEW.created_at,
+                NEW.remind_minutes));
+        END
+        """,
+    ],
+]
+
+# タスクの状態。active 以外は archived_tasks にある
+COMPLETED = "completed"  # 完了にした
+EXPIRED = "expired"      # 期限を ARCHIVE_AFTER_DAYS 日過ぎて自動で片付けた
+ARCHIVE_AFTER_DAYS = 30
+
+# store.Task の引数の順
+TASK_COLUMNS = "id, name, detail, category, due_date, importance, created_at, remind_minutes"
+# store.Task の属性名 -> tasks の列名（id 以外）
+FIELD_COLUMNS = {"name": "name", "detail": "detail", "category": "category", "due": "due_date",
+                 "importance": "importance", "created_at": "created_at", "remind_minutes": "remind_minutes"}
+# recurrence.Recurrence の引数の順
+RECURRENCE_COLUMNS = "id, name, detail, category, importance, rule, remind_minutes, last_at, next_at"
+CHANGELOG_KEEP = 100000  # changelog に残す版の数。これより遅れたクライアントは全件を取り直す
+
+
+def connect(path=DB_PATH, **kwargs):
+    conn = sqlite3.connect(path, **kwargs)
+    # WAL なら表示側の読み込みが書き込みを待たない
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-8000")  # 約8MB
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+@PROFILER.profiled("db.active_tasks")
+def active_tasks(conn):
+    # カーソルを返すので、fetchmany で少しずつ読める
+    return conn.execute(f"SELECT {TASK_COLUMNS} FROM tasks WHERE status='active' ORDER BY id")
+
+
+def next_task_id(conn):
+    # 書き込みスレッドに INSERT を任せても ID をその場で決められるよう、GUI 側で採番する
+    row = conn.execute("SELECT MAX(id) FROM tasks").fetchone()
+    archived = conn.execute("SELECT MAX(id) FROM archived_tasks").fetchone()
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='tasks'").fetchone()
+    return max(row[0] or 0, archived[0] or 0, seq[0] if seq else 0) + 1
+
+
+def insert_sql():
+    return ("INSERT INTO tasks (name, detail, category, due_date, importance, created_at, remind_minutes) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+
+def insert_occurrence_sql(or_ignore=True):
+    # 繰り返しの1回分。id が None なら自動で採番。同じ回がもうあれば（idx_tasks_occurrence）、
+    # or_ignore なら何もしない。画面側はタスクを先に TaskStore に入れるので、黙って捨てずにエラーにする
+    verb = "INSERT OR IGNORE" if or_ignore else "INSERT"
+    return (f"{verb} INTO tasks (id, name, detail, category, due_date, importance, created_at, "
+            "remind_minutes, recurrence_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+def save_recurrence_sql():
+    # 追加にも last_at / next_at を進めたときの保存にも使う
+    return f"INSERT OR REPLACE INTO recurrences ({RECURRENCE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+def recurrences(conn):
+    return conn.execute(f"SELECT {RECURRENCE_COLUMNS} FROM recurrences ORDER BY id").fetchall()
+
+
+def occurrence_dues(conn, recurrence_id):
+    # その繰り返しの回として tasks にもうある期限の集合
+    rows = conn.execute("SELECT due_date FROM tasks WHERE recurrence_id = ?", (recurrence_id,))
+    return {row[0] for row in rows}
+
+
+def next_recurrence_id(conn):
+    row = conn.execute("SELECT MAX(id) FROM recurrences").fetchone()
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='recurrences'").fetchone()
+    return max(row[0] or 0, seq[0] if seq else 0) + 1
+
+
+def update_sql(task_id, fields):
+    # fields は TaskStore.update と同じ {属性名: 値}。知らない名前なら KeyError
+    sets = ", ".join(f"{FIELD_COLUMNS[name]}=?" for name in fields)
+    return f"UPDATE tasks SET {sets} WHERE id=?", (*fields.values(), task_id)
+
+
+def set_status_sql(task_ids):
+    # この UPDATE 1文で tasks から archived_tasks に移る（マイグレーション4のトリガー）
+    return f"UPDATE tasks SET status=? WHERE id IN ({', '.join('?' * len(task_ids))})"
+
+
+def expire_overdue(conn, now=None, days=ARCHIVE_AFTER_DAYS):
+    # 期限を days 日以上過ぎた active のタスクを片付ける。片付けた件数を返す
+    now = now or datetime.datetime.now()
+    cutoff = (now - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    with conn:
+        cursor = conn.execute("UPDATE tasks SET status=? WHERE status='active' AND due_date != 'none' "
+                              "AND datetime(due_date) < datetime(?)", (EXPIRED, cutoff))
+    return cursor.rowcount
+
+
+def has_fts(conn):
+    # migration 5 で tasks_fts を作れたか（trigram が使えない SQLite では作らない）
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='tasks_fts'").fetchone() is not None
+
+
+def _like(term):
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+@PROFILER.profiled("db.search")
+def search(conn, text="", category=None, min_importance=None, max_importance=None, due_from=None, due_to=None):
+    # 条件に合う active なタスクの ID の集合。空白区切りの語はすべて含むもの（AND）。
+    # 3文字以上の語は tasks_fts、2文字以下は trigram で引けないので LIKE で絞る（tasks_fts がなければ全部 LIKE）。
+    # due_from / due_to は "YYYY-MM-DD" か "YYYY-MM-DD HH:MM:SS"（due_to は含まない）。期限なしはどちらかを指定すると外れる
+    where, params = [], []
+    terms = text.split()
+    indexed = [t for t in terms if len(t) >= 3] if has_fts(conn) else []
+    if indexed:
+        where.append("id IN (SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH ?)")
+        params.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in indexed))
+    for term in terms:
+        if term not in indexed:
+            where.append("(name LIKE ? ESCAPE '\\' OR detail LIKE ? ESCAPE '\\')")
+            params += [_like(term), _like(term)]
+    if category is not None:
+        where.append("category = ?")
+        params.append(category)
+    if min_importance is not None:
+        where.append("importance >= ?")
+        params.append(min_importance)
+    if max_importance is not None:
+        where.append("importance <= ?")
+        params.append(max_importance)
+    if due_from is not None or due_to is not None:
+        where.append("due_date != 'none'")
+    if due_from is not None:
+        where.append("due_date >= ?")
+        params.append(due_from)
+    if due_to is not None:
+        where.append("due_date < ?")
+        params.append(due_to)
+    sql = "SELECT id FROM tasks"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return {row[0] for row in conn.execute(sql, params)}
+
+
+@PROFILER.profiled("db.history")
+def history(conn, category=None, status=None, since=None, until=None, limit=200, offset=0):
+    # 片付けたタスクを新しい順に。since / until は archived_at（ISO 形式）の範囲。
+    # 返る行は TASK_COLUMNS の後ろに status, archived_at
+    where, params = [], []
+    for column, op, value in (("category", "=", category), ("status", "=", status),
+                              ("archived_at", ">=", since), ("archived_at", "<", until)):
+        if value is not None:
+            where.append(f"{column} {op} ?")
+            params.append(value)
+    sql = f"SELECT {TASK_COLUMNS}, status, archived_at FROM archived_tasks"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY archived_at DESC, id DESC LIMIT ? OFFSET ?"
+    return conn.execute(sql, params + [limit, offset])
+
+
+def history_by_month(conn, category=None):
+    # [(YYYY-MM, 件数)] を新しい月から
+    sql = "SELECT substr(archived_at, 1, 7) AS month, COUNT(*) FROM archived_tasks"
+    params = ()
+    if category is not None:
+        sql += " WHERE category = ?"
+        params = (category,)
+    return conn.execute(sql + " GROUP BY month ORDER BY month DESC", params).fetchall()
+
+
+def changelog_version(conn):
+    # 最新の版。消した版の番号も再利用されないので sqlite_sequence から読む
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='changelog'").fetchone()
+    return row[0] if row else 0
+
+
+def changelog_oldest(conn):
+    # 残っている一番古い版。空なら None
+    return conn.execute("SELECT MIN(version) FROM changelog").fetchone()[0]
+
+
+def changes_since(conn, version, limit):
+    # [(版, op, task id, data)] を古い順に
+    return conn.execute("SELECT version, op, task_id, data FROM changelog WHERE version > ? ORDER BY version LIMIT ?",
+                        (version, limit)).fetchall()
+
+
+def prune_changelog(conn, keep=CHANGELOG_KEEP):
+    with conn:
+        conn.execute("DELETE FROM changelog WHERE version <= ?", (changelog_version(conn) - keep,))
+
+
+def schema_version(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    # sqlite3 の既定（isolation_level=""）は DDL の前で BEGIN しないので、with conn では
+    # 途中で失敗した CREATE/ALTER が残る。自動 BEGIN を止めて、版ごとに自分で BEGIN/COMMIT する
+    current = schema_version(conn)
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for version, statements in enumerate(MIGRATIONS, start=1):
+            if version <= current:
+                continue
+            conn.execute("BEGIN")
+            try:
+                for sql in statements:
+                    if callable(sql):
+                        sql(conn)
+                    else:
+                        conn.execute(sql)
+                conn.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+    finally:
+        conn.isolation_level = isolation_level
+    return len(MIGRATIONS)
@@ -0,0 +1,67 @@
+import colorsys
+import datetime
+import functools
+
+FADE_STEPS = 64          # 作成〜期限までの色の段階数
+FADE_START_RATIO = 0.2   # ← 0.0 なら完全白、0.2なら「やや白寄り」から始まる
+OVERDUE = -1             # fade_state が返す「期限切れ」の段階
+
+
+def to_epoch(value):
+    # "none" や壊れた文字列は None（期限なし扱い）
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def stamp(task):
+    # 毎回パースしないよう、タスクに epoch 秒を持たせておく。created_at / due を書き換えたら呼び直すこと
+    task.created_ts = to_epoch(task.created_at)
+    task.due_ts = to_epoch(task.due)
+    return task
+
+
+def category_colors(categories):
+    n = len(categories)
+    colors = {}
+    for i, cat in enumerate(categories):
+        h = i / max(n, 1)
+        r, g, b = [int(c * 255) for c in colorsys.hsv_to_rgb(h, 0.6, 1.0)]
+        colors[cat] = f"#{r:02x}{g:02x}{b:02x}"
+    return colors
+
+
+def hex_to_rgb(hex_code):
+    hex_code = hex_code.lstrip('#')
+    return tuple(int(hex_code[i:i+2], 16) for i in (0, 2, 4))
+
+
+@functools.lru_cache(maxsize=256)
+def build_palette(base_hex):
+    r0, g0, b0 = hex_to_rgb(base_hex)
+    palette = []
+    for step in range(FADE_STEPS):
+        ratio = step / (FADE_STEPS - 1)
+        adjusted_ratio = FADE_START_RATIO + (1 - FADE_START_RATIO) * ratio
+        r = int(255 - (255 - r0) * adjusted_ratio)
+        g = int(255 - (255 - g0) * adjusted_ratio)
+        b = int(255 - (255 - b0) * adjusted_ratio)
+        palette.append(f"#{r:02x}{g:02x}{b:02x}")
+    return tuple(palette)
+
+
+def fade_state(created_ts, due_ts, now):
+    # (段階, 次に段階が変わる時刻) を返す。期限なしは (None, None)、期限切れは (OVERDUE, None)
+    if due_ts is None:
+        return None, None
+    if now >= due_ts:
+        return OVERDUE, None
+    total = due_ts - created_ts if created_ts is not None else 0
+    if total <= 0:
+        return 0, due_ts
+    ratio = min(max((now - created_ts) / total, 0), 1)
+    step = min(int(ratio * FADE_STEPS), FADE_STEPS - 1)
+    if step + 1 >= FADE_STEPS:
+        return step, due_ts
+    return step, min(created_ts + total * (step + 1) / FADE_STEPS, due_ts)
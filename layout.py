@@ -0,0 +1,203 @@
+# squarified treemap（Bruls ら）。カテゴリ → タスクの2階層で、与えられた矩形をぴったり埋める
+
+RESCALE_TOLERANCE = 0.1  # 縦横比の変化がこの範囲なら前回の配置を伸縮して使い回す
+MIN_TILE_AREA = 10 * 10  # これより小さくなるタスクはカテゴリごとに「+N件」へまとめる
+
+
+def _worst(row_sum, row_max, row_min, short_side):
+    s2 = row_sum * row_sum
+    side2 = short_side * short_side
+    return max(side2 * row_max / s2, s2 / (side2 * row_min))
+
+
+def squarify(values, x, y, w, h):
+    # values は降順・正の値。合計が w*h になるように縮尺して (x0, y0, x1, y1) の float を返す
+    total = sum(values)
+    if total <= 0 or w <= 0 or h <= 0:
+        return [(x, y, x, y) for _ in values]
+    scale = w * h / total
+    areas = [v * scale for v in values]
+    x1_end, y1_end = x + w, y + h
+    rects = []
+    i, n = 0, len(areas)
+    while i < n:
+        short_side = min(w, h)
+        row_sum = areas[i]
+        row_max = row_min = areas[i]
+        worst = _worst(row_sum, row_max, row_min, short_side)
+        j = i + 1
+        while j < n:
+            a = areas[j]
+            candidate = _worst(row_sum + a, max(row_max, a), min(row_min, a), short_side)
+            if candidate > worst:
+                break
+            row_sum += a
+            row_max = max(row_max, a)
+            row_min = min(row_min, a)
+            worst = candidate
+            j += 1
+        last_row = j == n
+        if w >= h:
+            # 左端に縦一列で並べる
+            col_w = x1_end - x if last_row else row_sum / h
+            yy = y
+            for k in range(i, j):
+                y_next = y1_end if k == j - 1 else yy + areas[k] / col_w
+                rects.append((x, yy, x + col_w, y_next))
+                yy = y_next
+            x += col_w
+            w = x1_end - x
+        else:
+            # 上端に横一列で並べる
+            row_h = y1_end - y if last_row else row_sum / w
+            xx = x
+            for k in range(i, j):
+                x_next = x1_end if k == j - 1 else xx + areas[k] / row_h
+                rects.append((xx, y, x_next, y + row_h))
+                xx = x_next
+            y += row_h
+            h = y1_end - y
+        i = j
+    return rects
+
+
+def _rescale(rects, src, dst):
+    sx0, sy0, sx1, sy1 = src
+    dx0, dy0, dx1, dy1 = dst
+    kx = (dx1 - dx0) / (sx1 - sx0)
+    ky = (dy1 - dy0) / (sy1 - sy0)
+    return [(dx0 + (x0 - sx0) * kx, dy0 + (y0 - sy0) * ky, dx0 + (x1 - sx0) * kx, dy0 + (y1 - sy0) * ky)
+            for x0, y0, x1, y1 in rects]
+
+
+def _aspect(rect):
+    x0, y0, x1, y1 = rect
+    return (x1 - x0) / (y1 - y0) if y1 > y0 else 0
+
+
+class SpatialIndex:
+    # 重ならない矩形の当たり判定用の格子。1マスに入る矩形は数個なので、引くのはほぼ O(1)
+    def __init__(self, entries, width, height):
+        # entries は ((x0, y0, x1, y1), value) のリスト
+        self.cell = max(8, int((width * height / max(len(entries), 1)) ** 0.5))
+        self.cols = width // self.cell + 1
+        self.rows = height // self.cell + 1
+        self.buckets = {}
+        for rect, value in entries:
+            x0, y0, x1, y1 = rect
+            if x1 <= x0 or y1 <= y0:
+                continue
+            for row in range(max(y0 // self.cell, 0), min((y1 - 1) // self.cell, self.rows - 1) + 1):
+                for col in range(max(x0 // self.cell, 0), min((x1 - 1) // self.cell, self.cols - 1) + 1):
+                    self.buckets.setdefault(row * self.cols + col, []).append((rect, value))
+
+    def hit(self, x, y):
+        if x < 0 or y < 0:
+            return None
+        col, row = int(x) // self.cell, int(y) // self.cell
+        if col >= self.cols or row >= self.rows:
+            return None
+        for (x0, y0, x1, y1), value in self.buckets.get(row * self.cols + col, ()):
+            if x0 <= x < x1 and y0 <= y < y1:
+                return value
+        return None
+
+
+class TreemapLayout:
+    # カテゴリごとに前回の結果を持っておき、中身が変わったカテゴリだけ並べ直す
+    def __init__(self, min_area=MIN_TILE_AREA):
+        self.min_area = min_area
+        self._groups = {}         # category -> (version, rect, float rects, 個別に置いたタスク数)
+        self.category_rects = {}  # category -> (x0, y0, x1, y1)（直近の layout の結果）
+        self.overflow = {}        # category -> ((x0, y0, x1, y1), まとめたタスク数)
+        self.placed = []
+        self._size = (0, 0)
+        self._index = None
+
+    def invalidate(self):
+        self._groups.clear()
+
+    def layout(self, store, categories, width, height, collapsed=()):
+        # store は TaskStore。カテゴリ内の並びと重要度の合計は store が持っている。
+        # collapsed のカテゴリはタスクを並べず、カテゴリの矩形全体を1つのまとめブロック（overflow）にする
+        order = {cat: i for i, cat in enumerate(categories)}
+        cats = sorted((c for c, total in store.totals.items() if total > 0),
+                      key=lambda c: order.get(c, len(categories)))
+        cats.sort(key=lambda c: -store.totals[c])  # 安定ソートなので同点はカテゴリ順のまま
+        for cat in [c for c in self._groups if c not in store.totals]:
+            del self._groups[cat]
+        self._size = (width, height)
+        self._index = None
+        if not cats:
+            self.category_rects = {}
+            self.overflow = {}
+            self.placed = []
+            return []
+        top = squarify([store.totals[c] for c in cats], 0, 0, width, height)
+
+        placed = []
+        category_rects = {}
+        overflow = {}
+        for cat, rect in zip(cats, top):
+            members = store.positive(cat)
+            if cat in collapsed:
+                category_rects[cat] = _round_rect(rect)
+                overflow[cat] = (category_rects[cat], len(members))
+                continue
+            rects, shown = self._layout_group(cat, store.versions[cat], members, store.totals[cat], rect)
+            category_rects[cat] = _round_rect(rect)
+            for i in range(shown):
+                placed.append((members[i], _round_rect(rects[i])))
+            if shown < len(members):
+                overflow[cat] = (_round_rect(rects[shown]), len(members) - shown)
+        self.category_rects = category_rects
+        self.overflow = overflow
+        self.placed = placed
+        return placed
+
+    def hit_test(self, x, y):
+        # (x, y) にあるタスクを返す。「+N件」のまとめブロックならカテゴリ名（str）、何もなければ None
+        if self._index is None:
+            entries = [(rect, task) for task, rect in self.placed]
+            entries.extend((rect, cat) for cat, (rect, _) in self.overflow.items())
+            self._index = SpatialIndex(entries, *self._size)
+        return self._index.hit(x, y)
+
+    def _layout_group(self, cat, version, members, total, rect):
+        # (矩形のリスト, 個別に置いたタスク数) を返す。まとめた分があれば最後の矩形がそれ
+        cached = self._groups.get(cat)
+        if cached is not None and cached[0] == version:
+            old_rect, old_rects, shown = cached[1], cached[2], cached[3]
+            if old_rect == rect:
+                return old_rects, shown
+            old_aspect, new_aspect = _aspect(old_rect), _aspect(rect)
+            if old_aspect and new_aspect and abs(new_aspect / old_aspect - 1) <= RESCALE_TOLERANCE \
+                    and self._same_shown(members, shown, total, rect):
+                # キャッシュは並べ直したときの矩形のまま残し、伸縮の誤差が積み重ならないようにする
+                return _rescale(old_rects, old_rect, rect), shown
+        x0, y0, x1, y1 = rect
+        scale = (x1 - x0) * (y1 - y0) / total
+        # members は重要度の降順なので、小さすぎるタスクは後ろにまとまっている
+        shown = 0
+        while shown < len(members) and members[shown].importance * scale >= self.min_area:
+            shown += 1
+        values = [t.importance for t in members[:shown]]
+        if shown < len(members):
+            values.append(total - sum(values))
+        rects = squarify(values, x0, y0, x1 - x0, y1 - y0)
+        self._groups[cat] = (version, rect, rects, shown)
+        return rects, shown
+
+    def _same_shown(self, members, shown, total, rect):
+        # 新しい大きさでも個別に置くタスクの数が変わらないなら、前回の配置を伸縮してよい
+        x0, y0, x1, y1 = rect
+        scale = (x1 - x0) * (y1 - y0) / total
+        if shown and members[shown - 1].importance * scale < self.min_area:
+            return False
+        return shown == len(members) or members[shown].importance * scale < self.min_area
+
+
+def _round_rect(rect):
+    # 隣り合う矩形が同じ座標を丸めるので、整数化しても隙間や重なりは出ない
+    x0, y0, x1, y1 = rect
+    return (round(x0), round(y0), round(x1), round(y1))
@@ -1,37 +1,129 @@
+import argparse
+import ctypes
+import sys
 import tkinter as tk
 from tkinter import messagebox, simpledialog
 import time
-import sqlite3
 import datetime
-import json
-import colorsys
-from tkcalendar import DateEntry
+import db
+import fade
+from persist import PersistenceWorker
+from blink import BlinkService
+from store import (Task, TaskStore, TaskEvent, ADDED, UPDATED, CATEGORY_CHANGED, REMOVED, CLEARED, STYLE_CHANGED,
+                   DUE_FORMAT, InvalidTask, load_categories, save_categories, validate_importance, validate_task)
+from renderer import TaskCanvasRenderer, APP_STYLE, OUTPUT_STYLE
+from raster import RENDERERS
+import recurrence
+from scheduler import Scheduler
+from profiler import PROFILER, ProfilerOverlay, ProfileLog
+
+STARTUP_CHUNK = 2000  # 起動時に1回の after_idle で読み込むタスク数
+EXPIRE_CHECK_MS = 60 * 60 * 1000  # 期限切れの古いタスクを片付ける間隔
+HISTORY_LIMIT = 500  # 履歴画面に出す件数
+SEARCH_DELAY_MS = 150  # 打鍵が止まってから検索するまで
+SEARCH_REFRESH_MS = 300  # 検索中にタスクが変わったら、書き込みスレッドの commit を待って検索し直す
+SUMMARY_REFRESH_MS = 60 * 1000  # カテゴリ集計の画面を開いている間、期限切れの数を数え直す間隔
+ALL_CATEGORIES = "すべて"
+DUE_FILTERS = {  # 表示名 -> (今日から何日後以降, 何日後より前)。0 は今日の 0 時ではなく今の時刻
+    "期限: 指定なし": (None, None),
+    "今日まで": (None, 1),
+    "7日以内": (0, 7),
+    "30日以内": (0, 30),
+    "期限切れ": (None, 0),
+}
 
 
 class TaskApp:
-    def __init__(self, master):
+    def __init__(self, master, lazy_load=True, output_backend="vector", sync_address=None, profile_log=None,
+                 open_output=False, output_summary=False, profile_overlay=False):
+        self._started = time.perf_counter()
+        self.profile_log = ProfileLog(profile_log, master) if profile_log else None
+        self.startup_stats = {}  # 秒。first_paint（画面が出るまで）/ loaded（全タスク読み込み完了まで）
         self.master = master
-        master.title("タスク管理アプリ")
-        master.geometry("500x600")
-
-        self.db_path = "tasks.db"
-        self.conn = sqlite3.connect(self.db_path)
-        self._create_table()
-
-        self.categories = self._load_categories()
+        self.output_backend = output_backend  # 出力ウィンドウの描画方式（raster.RENDERERS のキー）
+        self.output_summary = output_summary  # 出力ウィンドウをカテゴリごとの集計ブロックで始める
+        self.profile_overlay = profile_overlay  # 可視化画面を計測のオーバーレイつきで開く（--profile）
+        master.title("タスク管理アプリ")  # 大きさは固定せず、入力欄とボタンが全部入る大きさにする
+
+        self.db_path = db.DB_PATH
+        # sync_address（"host:port"）があれば tasks.db は同期サーバーが持つ。読み書きは self.sync 経由で、
+        # 自分の変更もサーバーから差分として戻ってきてから TaskStore に入る
+        self.sync = None
+        self.conn = None
+        self.persist = None
+        if sync_address:
+            import sync  # asyncio ごと読み込むと重いので、同期するときだけ
+            lazy_load = False
+            host, port = sync.parse_address(sync_address)
+            self.sync = sync.SyncClient(host, port, master, self._on_sync_snapshot, self._on_sync_changes,
+                                        self._on_sync_error)
+        else:
+            self.conn = db.connect(self.db_path)  # 読み込み用。書き込みは self.persist のスレッドが行う
+            self._create_table()
+            db.expire_overdue(self.conn)  # 期限を大きく過ぎたものは読み込む前に archived_tasks へ
+            db.prune_changelog(self.conn)
+            self._next_task_id = db.next_task_id(self.conn)
+            self._next_recurrence_id = db.next_recurrence_id(self.conn)
+            self.persist = PersistenceWorker(self.db_path, master, self._on_persist_error)
+        master.protocol("WM_DELETE_WINDOW", self._on_exit)
+
+        self.categories = load_categories()
         self._generate_category_colors()
 
-        self.tasks = self._load_tasks_from_db()
-        self.task_rects = {}
+        # lazy_load なら先に空の画面を出して、タスクは _load_next_chunk で少しずつ流し込む
+        self.tasks = TaskStore() if lazy_load or self.sync else self._load_tasks_from_db()
+        self._load_cursor = None
 
         self._build_ui(master)
+        self.blink = BlinkService(master)
+        self.renderer = TaskCanvasRenderer(self.canvas, self, APP_STYLE)
+        self.renderer.follow_resize()
+        # タイルごとの tag_bind はせず、キャンバス全体の1つのバインドから renderer.task_at で引く
+        self.canvas.bind("<Double-Button-1>", self._on_left_double_click)
+        self.canvas.bind("<Double-Button-3>", self._on_right_double_click)
+        self.overlay = ProfilerOverlay(self.canvas)
+        master.bind("<F12>", self.overlay.toggle)
+        self.output_window = None  # 可視化画面は「可視化画面を開く」か open_output で初めて作る
+        self.edit_dialog = None    # 編集・期限選択の画面は初めて開くときに作り、閉じても隠すだけで使い回す
+        self.due_dialog = None
+        self.summary_window = None
+        self._summary_id = None
+        self.search_matches = None  # 検索に一致したタスクIDの集合（両方のキャンバスに反映）
+        self._search_id = None
+        # 期限前の通知（タスク ID ごと）と繰り返しの次の回を作る時刻。どちらも次の時刻まで何もしない
+        self.reminders = Scheduler(master)
+        self.recurrence_timer = Scheduler(master)
+        self.recurrences = {}  # id -> recurrence.Recurrence（同期中はサーバーが持つ）
+        self.tasks.subscribe(self._on_task_event)
+        self._schedule_reminders(self.tasks)
         self.update_time()
-        self.render_tasks()
-        self.blinking_rects = {}
-        self.blink_state = True
-        self.blink_overdue_rects()
-        self.output_window = None  # 初期化（あとで開く）
-        self.open_output_window()
+        if self.sync is None:
+            master.after(EXPIRE_CHECK_MS, self._expire_overdue)  # 同期中はサーバーが片付ける
+
+        # first_paint はキャンバスが実際に描かれたとき。Tk は Expose を受けてから idle で描き直すので、
+        # 最初の Expose の after_idle で測る（update_idletasks の直後ではまだ何も描かれていない）
+        self._first_expose = self.canvas.bind("<Expose>", self._on_first_expose, add="+")
+        # 重いもの（tkcalendar の読み込み・全画面の可視化画面）は最初の描画のあとに回す
+        master.after_idle(self._build_date_entry)
+        if open_output:
+            master.after_idle(self.open_output_window)
+        if lazy_load:
+            self._load_cursor = db.active_tasks(self.conn)
+            master.after_idle(self._load_next_chunk)
+        elif self.sync is None:
+            self._mark_startup("loaded")
+            self._start_recurrences()
+
+    def _on_first_expose(self, event):
+        self.canvas.unbind("<Expose>", self._first_expose)
+        self.master.after_idle(self._mark_startup, "first_paint")
+
+    def _mark_startup(self, name):
+        # startup_stats に残し、計測中なら --profile-log / オーバーレイにも startup.<name> として出す
+        now = time.perf_counter()
+        self.startup_stats[name] = now - self._started
+        if PROFILER.enabled:
+            PROFILER.record(f"startup.{name}", self._started, now)
 
     def _build_ui(self, master):
         self.time_label = tk.Label(master, text="", anchor="e")
@@ -54,92 +146,132 @@ class TaskApp:
         tk.Button(master, text="カテゴリ管理", command=self._open_category_manager).pack()
 
         tk.Label(master, text="期限日").pack()
-        self.date_entry = DateEntry(master, width=20, date_pattern='yyyy-mm-dd')
-        self.date_entry.pack()
+        # DateEntry は _build_date_entry で最初の描画のあとに入れる。それまでは今日の日付で扱う
+        self.date_frame = tk.Frame(master)
+        self.date_frame.pack()
+        self.date_entry = None
         self.no_due_var = tk.BooleanVar()
         self.no_due_check = tk.Checkbutton(master, text="期限を定めない", variable=self.no_due_var)
         self.no_due_check.pack()
 
-        time_frame = tk.Frame(master)
-        time_frame.pack()
-        tk.Label(time_frame, text="時").pack(side="left")
-        self.hour_var = tk.StringVar()
-        self.hour_var.set("12")
-        tk.OptionMenu(time_frame, self.hour_var, *[f"{i:02d}" for i in range(24)]).pack(side="left")
-        tk.Label(time_frame, text="分").pack(side="left")
-        self.minute_var = tk.StringVar()
-        self.minute_var.set("00")
-        tk.OptionMenu(time_frame, self.minute_var, *[f"{i:02d}" for i in range(60)]).pack(side="left")
+        self.hour_var = tk.StringVar(value="12")
+        self.minute_var = tk.StringVar(value="00")
+        _time_picker(master, self.hour_var, self.minute_var).pack()
 
         tk.Label(master, text="重要度（1以上の整数）").pack()
         self.importance_entry = tk.Entry(master, width=20)
         self.importance_entry.pack()
 
+        tk.Label(master, text="通知（期限の何分前か。空なら通知しない）").pack()
+        self.remind_entry = tk.Entry(master, width=20)
+        self.remind_entry.pack()
+
+        tk.Label(master, text=f"繰り返し（{recurrence.RULE_HELP}。期限日・時刻の代わり）").pack()
+        self.rule_entry = tk.Entry(master, width=50)
+        self.rule_entry.pack()
+
         self.add_button = tk.Button(master, text="タスクを追加", command=self.add_task)
         self.add_button.pack(pady=5)
 
-        self.canvas = tk.Canvas(master, bg="white", width=480, height=300)
-        self.canvas.pack(pady=10)
+        search_frame = tk.Frame(master)
+        search_frame.pack(pady=(5, 0))
+        tk.Label(search_frame, text="検索").pack(side="left")
+        self.search_var = tk.StringVar()
+        tk.Entry(search_frame, textvariable=self.search_var, width=16).pack(side="left")
+        self.search_category_var = tk.StringVar(value=ALL_CATEGORIES)
+        self.search_category_menu = tk.OptionMenu(search_frame, self.search_category_var, ALL_CATEGORIES,
+                                                  *self.categories)
+        self.search_category_menu.pack(side="left")
+        tk.Label(search_frame, text="重要度").pack(side="left")
+        self.search_min_var = tk.StringVar()
+        tk.Entry(search_frame, textvariable=self.search_min_var, width=3).pack(side="left")
+        tk.Label(search_frame, text="〜").pack(side="left")
+        self.search_max_var = tk.StringVar()
+        tk.Entry(search_frame, textvariable=self.search_max_var, width=3).pack(side="left")
+        self.search_due_var = tk.StringVar(value=next(iter(DUE_FILTERS)))
+        tk.OptionMenu(search_frame, self.search_due_var, *DUE_FILTERS).pack(side="left")
+        for var in (self.search_var, self.search_category_var, self.search_min_var, self.search_max_var,
+                    self.search_due_var):
+            var.trace_add("write", lambda *_: self._schedule_search())
+
+        # 下のボタン列はキャンバスより先に side="bottom" で置く。後から pack すると
+        # ウィンドウが低いときにキャンバスに押し出されて見えなくなる
+        button_frame = tk.Frame(master)
+        button_frame.pack(side="bottom", pady=5)
         self.reset_button = tk.Button(master, text="全てリセット（ダブルクリック）")
-        self.reset_button.pack(pady=5)
+        self.reset_button.pack(side="bottom", pady=5)
         self.reset_button.bind("<Double-Button-1>", self._confirm_reset)
-        self.show_output_button = tk.Button(master, text="可視化画面を開く", command=self.open_output_window)
-        self.show_output_button.pack(pady=5)
+        self.canvas = tk.Canvas(master, bg="white", width=480, height=300)
+        self.canvas.pack(pady=10, fill="both", expand=True)
+        self.show_output_button = tk.Button(button_frame, text="可視化画面を開く", command=self.open_output_window)
+        self.show_output_button.pack(side="left", padx=5)
+        tk.Button(button_frame, text="履歴", command=self._open_history).pack(side="left", padx=5)
+        tk.Button(button_frame, text="繰り返し", command=self._open_recurrences).pack(side="left", padx=5)
+        tk.Button(button_frame, text="カテゴリ集計", command=self._open_summary).pack(side="left", padx=5)
 
 
-    def _load_categories(self, path="categories.json"):
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                categories = json.load(f)
-                if not categories:
-                    raise ValueError
-                return categories
-        except:
-            return ["医学"]
-
-    def _save_categories(self, path="categories.json"):
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(self.categories, f, ensure_ascii=False)
+    def _build_date_entry(self):
+        if self.date_entry is None:
+            self.date_entry = _date_entry(self.date_frame)
+            self.date_entry.pack()
+
+    def _selected_date(self):
+        if self.date_entry is None:
+            return datetime.date.today().isoformat()
+        return self.date_entry.get()
 
     def _generate_category_colors(self):
-        n = len(self.categories)
-        self.category_colors = {}
-        for i, cat in enumerate(self.categories):
-            h = i / max(n, 1)
-            r, g, b = [int(c * 255) for c in colorsys.hsv_to_rgb(h, 0.6, 1.0)]
-            hex_color = f"#{r:02x}{g:02x}{b:02x}"
-            self.category_colors[cat] = hex_color
+        self.category_colors = fade.category_colors(self.categories)
+        self.category_palettes = {cat: fade.build_palette(c) for cat, c in self.category_colors.items()}
     def open_output_window(self):
         if self.output_window is None or not self.output_window.winfo_exists():
-            self.output_window = OutputWindow(self.master, self)
+            self.output_window = OutputWindow(self.master, self, self.output_backend, self.output_summary)
         else:
             self.output_window.lift()  # すでに開いていれば前面に
 
     def _create_table(self):
-        c = self.conn.cursor()
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT,
-                detail TEXT,
-                category TEXT,
-                due_date TEXT,
-                importance INTEGER,
-                created_at TEXT
-            )
-        ''')
-        self.conn.commit()
+        # tasks テーブルの作成とスキーマ更新（db.MIGRATIONS）
+        db.migrate(self.conn)
 
     def _load_tasks_from_db(self):
-        c = self.conn.cursor()
-        c.execute("SELECT name, detail, category, due_date, importance, created_at FROM tasks")
-        rows = c.fetchall()
-        return [{"name": r[0], "detail": r[1], "category": r[2], "due": r[3], "importance": r[4], "created_at": r[5]} for r in rows]
+        return TaskStore(Task(*r) for r in db.active_tasks(self.conn))
 
+    @PROFILER.profiled("app.load_chunk", frame=True)
+    def _load_next_chunk(self):
+        if self._load_cursor is None:
+            return
+        rows = self._load_cursor.fetchmany(STARTUP_CHUNK)
+        if rows:
+            self.tasks.load(Task(*r) for r in rows)
+        if len(rows) < STARTUP_CHUNK:
+            self._stop_loading()
+            self._mark_startup("loaded")
+            self._start_recurrences()  # 読み込み中に回を足すと、同じタスクをカーソルからもう一度読んでしまう
+            return
+        self.master.after_idle(self._load_next_chunk)
+
+    def _on_sync_snapshot(self, rows):
+        from sync import apply_snapshot
+        apply_snapshot(self.tasks, rows)
+        if "loaded" not in self.startup_stats:
+            self._mark_startup("loaded")
+
+    def _on_sync_changes(self, changes):
+        from sync import apply_changes
+        apply_changes(self.tasks, changes)
+
+    def _on_sync_error(self, message):
+        messagebox.showerror("同期エラー", message)
+
+    def _stop_loading(self):
+        if self._load_cursor is not None:
+            self._load_cursor.close()
+            self._load_cursor = None
+
+    @PROFILER.profiled("app.clock", frame=True)
     def update_time(self):
         self.time_label.config(text=time.strftime("%H:%M:%S"))
         self.master.after(1000, self.update_time)
-        self.render_tasks()
 
     def add_task(self):
         name = self.task_entry.get().strip()
@@ -148,223 +280,221 @@ class TaskApp:
         if self.no_due_var.get():
             due = "none"
         else:
-            due = f"{self.date_entry.get()} {self.hour_var.get()}:{self.minute_var.get()}:00"
+            due = _format_due(self._selected_date(), self.hour_var.get(), self.minute_var.get())
 
         importance = self.importance_entry.get().strip()
+        rule = self.rule_entry.get().strip()
 
-        if not name:
-            messagebox.showwarning("入力エラー", "タスク名は必須です。")
+        try:
+            name, importance, due = validate_task(name, importance, "none" if rule else due)
+            remind = recurrence.parse_remind(self.remind_entry.get())
+            if rule:
+                recurrence.parse_rule(rule)
+        except InvalidTask as e:
+            messagebox.showwarning("入力エラー", str(e))
             return
 
-        try:
-            importance = int(importance)
-            if importance <= 0:
-                raise ValueError
-        except:
-            messagebox.showwarning("入力エラー", "重要度は1以上の整数で入力してください。")
+        if rule:
+            self._add_recurrence(name, detail, category, importance, rule, remind)
+            self._clear_inputs()
             return
 
         created_at = datetime.datetime.now().isoformat()
 
-        c = self.conn.cursor()
-        c.execute("INSERT INTO tasks (name, detail, category, due_date, importance, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                  (name, detail, category, due, importance, created_at))
-        self.conn.commit()
+        if self.sync:
+            # ID はサーバーが決める。タスクは差分として戻ってきたときに表示される
+            self.sync.send("add", task={"name": name, "detail": detail, "category": category, "due": due,
+                                        "importance": importance, "created_at": created_at,
+                                        "remind_minutes": remind})
+            self._clear_inputs()
+            return
+
+        task_id = self._next_task_id
+        self._next_task_id += 1
+        self.persist.submit("INSERT INTO tasks (id, name, detail, category, due_date, importance, created_at, "
+                            "remind_minutes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (task_id, name, detail, category, due, importance, created_at, remind))
 
-        self.tasks.append({"name": name, "detail": detail, "category": category, "due": due,
-                           "importance": importance, "created_at": created_at})
+        self.tasks.add(Task(task_id, name, detail, category, due, importance, created_at, remind))
 
         self._clear_inputs()
-        self.render_tasks()
-        if self.output_window:
-            self.output_window.render_tasks()
 
 
     def _clear_inputs(self):
         self.task_entry.delete(0, tk.END)
         self.detail_entry.delete(0, tk.END)
         self.importance_entry.delete(0, tk.END)
+        self.remind_entry.delete(0, tk.END)
+        self.rule_entry.delete(0, tk.END)
 
-    def render_tasks(self):
-        self.canvas.delete("all")
-        self.task_rects.clear()
-        if not self.tasks:
-            return
+    def _on_left_double_click(self, event):
+        task = self.renderer.task_at(event.x, event.y)
+        if task and messagebox.askyesno("削除確認", f"{task.name} を削除してもよいですか？"):
+            self._delete_task(task)
 
-        tasks = sorted(
-            self.tasks,
-            key=lambda t: self.categories.index(t["category"]) if t["category"] in self.categories else len(self.categories)
-        )
-        total = sum(t["importance"] for t in tasks)
-        if total == 0:
+    def _delete_task(self, task):
+        if self.sync:
+            self.sync.send("delete", id=task.id)
             return
+        self.persist.submit("DELETE FROM tasks WHERE id=?", (task.id,))
+        self.tasks.remove(task)
 
-        width, height = 480, 300
-        x, y = 0, 0
-        row_height = 0
-
-        for task in tasks:
-            area_ratio = task["importance"] / total
-            area = width * height * area_ratio
-            w = max(int(area ** 0.5), 1)
-            h = max(int(area / w), 1)
-            if x + w > width:
-                x = 0
-                y += row_height
-                row_height = 0
-            base_color = self.category_colors.get(task["category"], "#cccccc")
-            fill_color = self._get_faded_color(base_color, task["created_at"], task["due"])
-            rect_id = self.canvas.create_rectangle(x, y, x + w, y + h, fill=fill_color, outline=base_color, width=4)
-            self.canvas.create_text(x + 4, y + 4, anchor="nw", text=task["name"], font=("Arial", 8, "bold"))
-            self.canvas.create_text(x + 4, y + 20, anchor="nw", text=task["detail"], font=("Arial", 7), fill="gray20")
-            self.task_rects[rect_id] = task
-            self.canvas.tag_bind(rect_id, "<Double-Button-1>", self._on_left_double_click)
-            self.canvas.tag_bind(rect_id, "<Double-Button-3>", self._on_right_double_click)
-            x += w
-            row_height = max(row_height, h)
-            try:
-                due_dt = datetime.datetime.fromisoformat(task["due"])
-                if due_dt < datetime.datetime.now():
-                    self.blinking_rects[rect_id] = True
-            except:
-                pass
-        if task["due"] != "none":
-            self.canvas.create_text(x + 4, y + 36, anchor="nw", 
-                text=f"期限: {task['due']}", font=("Arial", 7), fill="gray40")
-
-            
-    def blink_overdue_rects(self):
-        for rect_id in list(self.blinking_rects.keys()):
-            try:
-                self.canvas.itemconfig(
-                    rect_id,
-                    fill="#ff0000" if self.blink_state else ""
-                )
-            except tk.TclError:
-                del self.blinking_rects[rect_id]
-        self.blink_state = not self.blink_state
-        self.master.after(500, self.blink_overdue_rects)
-
-    def _get_faded_color(self, base_hex, created_at_str, due_str):
-        if due_str == "none":
-            # 期限なしの中間色（固定色）
-            return base_hex
+    def update_task(self, task, **fields):
+        # fields は TaskStore.update と同じ {属性名: 値}
+        if self.sync:
+            self.sync.send("update", id=task.id, fields=fields)
+            return
+        self.persist.submit(*db.update_sql(task.id, fields))
+        self.tasks.update(task, **fields)
+
+    def _complete_task(self, task):
+        # 消さずに archived_tasks へ移す（履歴に残る）
+        self._set_status([task], db.COMPLETED)
+
+    def _set_status(self, tasks, status):
+        for i in range(0, len(tasks), 500):
+            chunk = tasks[i:i + 500]
+            ids = [t.id for t in chunk]
+            if self.sync:
+                self.sync.send("status", ids=ids, status=status)
+                continue
+            self.persist.submit(db.set_status_sql(ids), (status, *ids))
+            for task in chunk:
+                self.tasks.remove(task)
+
+    @PROFILER.profiled("app.expire", frame=True)
+    def _expire_overdue(self):
+        # 起動中に期限を ARCHIVE_AFTER_DAYS 日過ぎたものも片付ける（起動時は db.expire_overdue）
+        cutoff = time.time() - db.ARCHIVE_AFTER_DAYS * 24 * 60 * 60
+        expired = [t for t in self.tasks if t.due_ts is not None and t.due_ts < cutoff]
+        if expired:
+            self._set_status(expired, db.EXPIRED)
+        self.master.after(EXPIRE_CHECK_MS, self._expire_overdue)
+
+    def _open_history(self):
+        if self.sync:
+            self.sync.request("history_by_month", {}, lambda months: self.sync.request(
+                "history", {"limit": HISTORY_LIMIT}, lambda rows: self._show_history(months, rows)))
+        else:
+            self._show_history(db.history_by_month(self.conn), db.history(self.conn, limit=HISTORY_LIMIT))
 
+    def _show_history(self, months, rows):
+        win = tk.Toplevel(self.master)
+        win.title("履歴（完了・期限切れ）")
+        labels = {db.COMPLETED: "完了", db.EXPIRED: "期限切れ"}
+        summary = "  ".join(f"{month}: {count}件" for month, count in months[:6]) or "履歴はありません"
+        tk.Label(win, text=summary).pack(anchor="w")
+        listbox = tk.Listbox(win, width=80, height=25)
+        listbox.pack(fill="both", expand=True)
+        for row in rows:
+            _, name, _, category, due, importance, _, _, status, archived_at = row
+            listbox.insert(tk.END, f"{archived_at[:16]}  [{labels.get(status, status)}] {category} / {name}"
+                                   f"（重要度 {importance}、期限 {due}）")
+
+    def _add_recurrence(self, name, detail, category, importance, rule, remind):
+        if self.sync:
+            # 回のタスクはサーバーが作って差分で流してくる
+            self.sync.send("add_recurrence", recurrence={"name": name, "detail": detail, "category": category,
+                                                         "importance": importance, "rule": rule,
+                                                         "remind_minutes": remind})
+            return
         try:
-            created_at = datetime.datetime.fromisoformat(created_at_str)
-            due = datetime.datetime.fromisoformat(due_str)
-            now = datetime.datetime.now()
-            total = (due - created_at).total_seconds()
-            elapsed = (now - created_at).total_seconds()
-            ratio = min(max(elapsed / total, 0), 1)
-        except:
-            ratio = 0
-
-        fade_start_ratio = 0.2  # ← 0.0 なら完全白、0.2なら「やや白寄り」から始まる
-        adjusted_ratio = fade_start_ratio + (1 - fade_start_ratio) * ratio
+            rec = recurrence.new_recurrence(self._next_recurrence_id, name, detail, category, importance, rule,
+                                            remind, datetime.datetime.now())
+        except InvalidTask as e:
+            messagebox.showwarning("入力エラー", str(e))
+            return
+        self._next_recurrence_id += 1
+        self.recurrences[rec.id] = rec
+        self.persist.submit(db.save_recurrence_sql(), rec.row())
+        if self._load_cursor is None:
+            self._materialize(rec.id)
+
+    def _start_recurrences(self):
+        # 作る時刻を過ぎているもの（閉じていた間の分など）はすぐに作られる
+        for row in db.recurrences(self.conn):
+            self.recurrences.setdefault(row[0], recurrence.Recurrence(*row))
+        for rec in self.recurrences.values():
+            self._schedule_recurrence(rec)
+
+    def _schedule_recurrence(self, rec):
+        wake = rec.wake_time()
+        if wake is None:
+            return
+        self.recurrence_timer.schedule(rec.id, wake.timestamp(), lambda: self._materialize(rec.id))
 
-        r, g, b = self._hex_to_rgb(base_hex)
-        r = int(255 - (255 - r) * adjusted_ratio)
-        g = int(255 - (255 - g) * adjusted_ratio)
-        b = int(255 - (255 - b) * adjusted_ratio)
-        return f"#{r:02x}{g:02x}{b:02x}"
+    @PROFILER.profiled("app.materialize", frame=True)
+    def _materialize(self, recurrence_id):
+        # HORIZON 先までの回をタスクにして、次に作る時刻を予約し直す
+        rec = self.recurrences.get(recurrence_id)
+        if rec is None:
+            return
+        added = []
+        occurrences = rec.materialize(datetime.datetime.now())
+        # 同期サーバーなどがもう作った回は飛ばす。作らなかった回を TaskStore にだけ残さないように
+        existing = db.occurrence_dues(self.conn, rec.id) if occurrences else set()
+        for created_at, due in occurrences:
+            if due in existing:
+                continue
+            task_id = self._next_task_id
+            self._next_task_id += 1
+            self.persist.submit(db.insert_occurrence_sql(or_ignore=False), rec.task_values(task_id, created_at, due))
+            added.append(Task(task_id, rec.name, rec.detail, rec.category, due, rec.importance, created_at,
+                              rec.remind_minutes))
+        self.persist.submit(db.save_recurrence_sql(), rec.row())
+        self.tasks.load(added)
+        self._schedule_recurrence(rec)
+
+    def _open_recurrences(self):
+        if self.sync:
+            self.sync.request("recurrences", {}, self._show_recurrences)
+        else:
+            self._show_recurrences([rec.row() for rec in self.recurrences.values()])
 
+    def _show_recurrences(self, rows):
+        win = tk.Toplevel(self.master)
+        win.title("繰り返し")
+        listbox = tk.Listbox(win, width=80, height=15)
+        listbox.pack(fill="both", expand=True)
+        ids = []
+        for rec_id, name, _, category, importance, rule, remind, _, next_at in rows:
+            remind = f"、{remind}分前に通知" if remind is not None else ""
+            listbox.insert(tk.END, f"{rule}  {category} / {name}（重要度 {importance}{remind}）"
+                                   f"  次回 {(next_at or 'なし')[:16]}")
+            ids.append(rec_id)
 
-    def _hex_to_rgb(self, hex_code):
-        hex_code = hex_code.lstrip('#')
-        return tuple(int(hex_code[i:i+2], 16) for i in (0, 2, 4))
+        def delete():
+            sel = listbox.curselection()
+            if sel and messagebox.askyesno("削除確認", "この繰り返しをやめますか？（作成済みのタスクは残ります）",
+                                           parent=win):
+                self._delete_recurrence(ids.pop(sel[0]))
+                listbox.delete(sel[0])
 
-    def _on_left_double_click(self, event):
-        canvas_id = event.widget.find_closest(event.x, event.y)[0]
-        task = self.task_rects.get(canvas_id)
-        if task and messagebox.askyesno("削除確認", f"{task['name']} を削除してもよいですか？"):
-            self._delete_task(task)
+        tk.Button(win, text="削除", command=delete).pack(pady=5)
 
-    def _delete_task(self, task):
-        c = self.conn.cursor()
-        c.execute("DELETE FROM tasks WHERE name=? AND created_at=?", (task["name"], task["created_at"]))
-        self.conn.commit()
-        self.tasks.remove(task)
-        self.render_tasks()
-        if self.output_window:
-           self.output_window.render_tasks()
+    def _delete_recurrence(self, recurrence_id):
+        if self.sync:
+            self.sync.send("delete_recurrence", id=recurrence_id)
+            return
+        self.recurrences.pop(recurrence_id, None)
+        self.recurrence_timer.cancel(recurrence_id)
+        self.persist.submit("DELETE FROM recurrences WHERE id=?", (recurrence_id,))
 
 
     def _on_right_double_click(self, event):
-        canvas_id = event.widget.find_closest(event.x, event.y)[0]
-        task = self.task_rects.get(canvas_id)
+        task = self.renderer.task_at(event.x, event.y)
         if task:
             self._open_edit_dialog(task)
 
     def _open_edit_dialog(self, task):
-        win = tk.Toplevel(self.master)
-        win.title("タスク編集")
-
-        name_entry = tk.Entry(win, width=40)
-        name_entry.insert(0, task["name"])
-        name_entry.pack()
-
-        detail_entry = tk.Entry(win, width=40)
-        detail_entry.insert(0, task["detail"])
-        detail_entry.pack()
-
-        due_str = task.get("due", "")
-        if due_str == "none":
-            date = datetime.datetime.now().strftime("%Y-%m-%d")
-            hour = "12"
-            minute = "00"
-        else:
-            try:
-                date_part, time_part = due_str.split(" ")
-                date = date_part
-                hour, minute = time_part[:5].split(":")
-            except Exception:
-                date = datetime.datetime.now().strftime("%Y-%m-%d")
-                hour = "12"
-                minute = "00"
-
-        date_entry = DateEntry(win, width=20, date_pattern='yyyy-mm-dd')
-        date_entry.set_date(date)
-        date_entry.pack()
-
-        time_frame = tk.Frame(win)
-        time_frame.pack()
-        hour_var = tk.StringVar()
-        hour_var.set(hour)
-        tk.Label(time_frame, text="時").pack(side="left")
-        tk.OptionMenu(time_frame, hour_var, *[f"{i:02d}" for i in range(24)]).pack(side="left")
-        minute_var = tk.StringVar()
-        minute_var.set(minute)
-        tk.Label(time_frame, text="分").pack(side="left")
-        tk.OptionMenu(time_frame, minute_var, *[f"{i:02d}" for i in range(60)]).pack(side="left")
-
-        importance_entry = tk.Entry(win, width=10)
-        importance_entry.insert(0, str(task["importance"]))
-        importance_entry.pack()
-
-        def save():
-            try:
-                new_importance = int(importance_entry.get())
-            except:
-                messagebox.showerror("エラー", "重要度は整数で入力してください")
-                return
-            new_due = f"{date_entry.get()} {hour_var.get()}:{minute_var.get()}:00"
-            c = self.conn.cursor()
-            c.execute("""
-                UPDATE tasks SET name=?, detail=?, due_date=?, importance=?
-                WHERE name=? AND created_at=?
-            """, (name_entry.get(), detail_entry.get(), new_due, new_importance,
-                task["name"], task["created_at"]))
-            self.conn.commit()
-            task["name"] = name_entry.get()
-            task["detail"] = detail_entry.get()
-            task["due"] = new_due
-            task["importance"] = new_importance
-            win.destroy()
-            self.render_tasks()
-
-        tk.Button(win, text="保存", command=save).pack(pady=5)
+        if self.edit_dialog is None:
+            self.edit_dialog = EditDialog(self.master, self)
+        self.edit_dialog.show(task)
 
+    def _open_due_dialog(self, task):
+        if self.due_dialog is None:
+            self.due_dialog = DueDialog(self.master, self)
+        self.due_dialog.show(task)
 
     def _open_category_manager(self):
         win = tk.Toplevel(self.master)
@@ -378,11 +508,11 @@ class TaskApp:
             new = simpledialog.askstring("カテゴリ追加", "新しいカテゴリ名：", parent=win)
             if new and new not in self.categories:
                 self.categories.append(new)
-                self._save_categories()
+                save_categories(self.categories)
                 self._generate_category_colors()
                 listbox.insert(tk.END, new)
                 self._refresh_category_menu()
-                self.render_tasks()
+                self.tasks.emit(TaskEvent(STYLE_CHANGED))
 
         def delete():
             sel = listbox.curselection()
@@ -390,11 +520,11 @@ class TaskApp:
                 cat = self.categories[sel[0]]
                 if messagebox.askyesno("削除確認", f"{cat} を削除しますか？"):
                     del self.categories[sel[0]]
-                    self._save_categories()
+                    save_categories(self.categories)
                     self._generate_category_colors()
                     listbox.delete(sel[0])
                     self._refresh_category_menu()
-                    self.render_tasks()
+                    self.tasks.emit(TaskEvent(STYLE_CHANGED))
 
         tk.Button(win, text="追加", command=add).pack(side="left")
         tk.Button(win, text="削除", command=delete).pack(side="left")
@@ -404,21 +534,329 @@ class TaskApp:
         menu.delete(0, 'end')
         for c in self.categories:
             menu.add_command(label=c, command=lambda v=c: self.category_var.set(v))
+        menu = self.search_category_menu['menu']
+        menu.delete(0, 'end')
+        for c in [ALL_CATEGORIES] + self.categories:
+            menu.add_command(label=c, command=lambda v=c: self.search_category_var.set(v))
+
+    def _open_summary(self):
+        # カテゴリごとの件数・重要度の合計・期限切れ・次の期限（TaskStore.summaries）。ダブルクリックでそのカテゴリに絞る
+        if self.summary_window is not None and self.summary_window.winfo_exists():
+            self.summary_window.lift()
+            return
+        win = self.summary_window = tk.Toplevel(self.master)
+        win.title("カテゴリ集計")
+        self.summary_list = tk.Listbox(win, width=70, height=15, font=("Courier", 10))
+        self.summary_list.pack(fill="both", expand=True)
+        self.summary_list.bind("<Double-Button-1>", self._on_summary_double_click)
+        tk.Label(win, text="ダブルクリックでそのカテゴリのタスクに絞り込み（可視化画面の集計表示では展開）").pack()
+        self._summary_rows = []
+        self._refresh_summary()
+
+    def _refresh_summary(self):
+        self._summary_id = None
+        if self.summary_window is None or not self.summary_window.winfo_exists():
+            self.summary_window = None
+            return
+        order = {cat: i for i, cat in enumerate(self.categories)}
+        rows = sorted(self.tasks.summaries(time.time()), key=lambda s: (-s.importance, order.get(s.category, 0)))
+        self._summary_rows = [s.category for s in rows]
+        self.summary_list.delete(0, tk.END)
+        for s in rows:
+            next_due = time.strftime("%m/%d %H:%M", time.localtime(s.next_due)) if s.next_due else "-"
+            self.summary_list.insert(tk.END, f"{s.category:<8} {s.count:>6}件  重要度 {s.importance:>7}"
+                                             f"  期限切れ {s.overdue:>5}  次の期限 {next_due}")
+        self._summary_id = self.master.after(SUMMARY_REFRESH_MS, self._refresh_summary)
+
+    def _schedule_summary(self):
+        # タスクの変更はまとめて1回だけ数え直す
+        if self.summary_window is None:
+            return
+        if self._summary_id is not None:
+            self.master.after_cancel(self._summary_id)
+        self._summary_id = self.master.after_idle(self._refresh_summary)
+
+    def _on_summary_double_click(self, event):
+        sel = self.summary_list.curselection()
+        if not sel:
+            return
+        cat = self._summary_rows[sel[0]]
+        self.search_category_var.set(cat)
+        if self.output_window is not None and self.output_window.winfo_exists():
+            renderer = self.output_window.renderer
+            if renderer.summary_mode and renderer.is_collapsed(cat):
+                renderer.toggle_category(cat)
+
+    def _on_task_event(self, event):
+        if self.search_matches is not None:
+            self._schedule_search(SEARCH_REFRESH_MS)
+        self._schedule_summary()
+        if event.kind == ADDED:
+            self._schedule_reminders(event.tasks)
+        elif event.kind in (UPDATED, CATEGORY_CHANGED) and {"due", "remind_minutes"} & set(event.fields):
+            self._schedule_reminders(event.tasks)
+        elif event.kind == REMOVED:
+            for task in event.tasks:
+                self.reminders.cancel(task.id)
+        elif event.kind == CLEARED:
+            self.reminders.clear()
+
+    def _schedule_reminders(self, tasks):
+        # 通知の時刻を過ぎていても期限前なら今すぐ知らせる。期限を過ぎたものは知らせない
+        now = time.time()
+        for task in tasks:
+            if task.remind_minutes is None or task.due_ts is None or task.due_ts <= now:
+                self.reminders.cancel(task.id)
+            else:
+                self.reminders.schedule(task.id, task.due_ts - task.remind_minutes * 60,
+                                        lambda task_id=task.id: self._remind(task_id))
+
+    def _remind(self, task_id):
+        task = self.tasks.get(task_id)
+        if task is None:
+            return
+        self.master.bell()
+        win = tk.Toplevel(self.master)
+        win.title("リマインダー")
+        win.attributes("-topmost", True)
+        minutes = max(int((task.due_ts - time.time()) // 60), 0)
+        tk.Label(win, text=f"{task.category} / {task.name}\n期限 {task.due}（あと{minutes}分）",
+                 padx=20, pady=10).pack()
+        tk.Button(win, text="閉じる", command=win.destroy).pack(pady=5)
+
+    def _schedule_search(self, delay=SEARCH_DELAY_MS):
+        if self._search_id is not None:
+            self.master.after_cancel(self._search_id)
+        self._search_id = self.master.after(delay, self._run_search)
+
+    @PROFILER.profiled("app.search", frame=True)
+    def _run_search(self):
+        # 絞り込みは SQLite（tasks_fts と各インデックス）に任せ、キャンバスには一致した ID だけ渡す
+        self._search_id = None
+        text = self.search_var.get().strip()
+        category = self.search_category_var.get()
+        category = None if category == ALL_CATEGORIES else category
+        min_importance = _int_or_none(self.search_min_var.get())
+        max_importance = _int_or_none(self.search_max_var.get())
+        start, end = DUE_FILTERS.get(self.search_due_var.get(), (None, None))
+        due_from, due_to = _due_bound(start), _due_bound(end)
+        filters = {"category": category, "min_importance": min_importance, "max_importance": max_importance,
+                   "due_from": due_from, "due_to": due_to}
+        if not text and all(v is None for v in filters.values()):
+            self._apply_matches(None)
+        elif self.sync:
+            self.sync.request("search", dict(filters, text=text), lambda ids: self._apply_matches(set(ids)))
+        else:
+            self._apply_matches(db.search(self.conn, text, **filters))
+
+    def _apply_matches(self, matches):
+        self.search_matches = matches
+        self.renderer.set_matches(matches)
+        if self.output_window is not None and self.output_window.winfo_exists():
+            self.output_window.renderer.set_matches(matches)
     def _confirm_reset(self, event):
         if messagebox.askyesno("全削除の確認", "本当に全てのタスクを削除しますか？この操作は元に戻せません。"):
             self._reset_all_tasks()
 
     def _reset_all_tasks(self):
-        c = self.conn.cursor()
-        c.execute("DELETE FROM tasks")
-        self.conn.commit()
+        if self.sync:
+            self.sync.send("clear")
+            return
+        self._stop_loading()
+        self.persist.submit("DELETE FROM tasks")
         self.tasks.clear()
-        self.render_tasks()
-        self.blinking_rects.clear()
 
+    def _on_persist_error(self, error):
+        messagebox.showerror("保存エラー", f"データベースへの書き込みに失敗しました：{error}")
+
+    def _on_exit(self):
+        # 積んである書き込みを全部 commit してから閉じる
+        if self.persist and not self.persist.close():
+            messagebox.showwarning("保存", "データベースへの書き込みが終わらないまま終了します。")
+        if self.sync:
+            self.sync.close()
+        if self.profile_log:
+            self.profile_log.close()
+        self.master.destroy()
+
+
+def _enable_dpi_awareness():
+    # Windows は DPI 非対応のアプリを引き伸ばしてぼかすので、Tk を作る前に対応を宣言する
+    if sys.platform != "win32":
+        return
+    try:
+        ctypes.windll.shcore.SetProcessDpiAwareness(1)
+    except (AttributeError, OSError):
+        pass
+
+
+def _date_entry(parent):
+    # tkcalendar（babel も連れてくる）は読み込みが重いので、初めて日付欄を作るときに import する
+    from tkcalendar import DateEntry
+    return DateEntry(parent, width=20, date_pattern='yyyy-mm-dd')
+
+
+def _time_picker(parent, hour_var, minute_var):
+    # 24 / 60 項目の OptionMenu は作るのが重いので Spinbox にする
+    frame = tk.Frame(parent)
+    tk.Label(frame, text="時").pack(side="left")
+    tk.Spinbox(frame, from_=0, to=23, format="%02.0f", wrap=True, width=3, textvariable=hour_var).pack(side="left")
+    tk.Label(frame, text="分").pack(side="left")
+    tk.Spinbox(frame, from_=0, to=59, format="%02.0f", wrap=True, width=3,
+               textvariable=minute_var).pack(side="left")
+    return frame
+
+
+def _format_due(date, hour, minute):
+    # Spinbox には手で "7" などと打てるので2桁にそろえる。数字でなければそのまま（validate_task で弾く）
+    try:
+        return f"{date} {int(hour):02d}:{int(minute):02d}:00"
+    except ValueError:
+        return f"{date} {hour}:{minute}:00"
+
+
+def _due_bound(days):
+    # DUE_FILTERS の日数を db.search の due_from / due_to に。0 は今の時刻にして、今日のうちに
+    # 過ぎたものも「期限切れ」に入れる（点滅や集計の期限切れと同じ）
+    if days is None:
+        return None
+    if days == 0:
+        return datetime.datetime.now().strftime(DUE_FORMAT)
+    return (datetime.date.today() + datetime.timedelta(days=days)).isoformat()
+
+
+def _int_or_none(value):
+    try:
+        return int(value.strip())
+    except ValueError:
+        return None
+
+
+class PooledDialog(tk.Toplevel):
+    # 開くたびに作り直さず、閉じたら隠して次に使い回す。show(task) で中身を入れ直す
+    def __init__(self, master, task_app, title):
+        super().__init__(master)
+        self.withdraw()
+        self.title(title)
+        self.task_app = task_app
+        self.task = None
+        self.protocol("WM_DELETE_WINDOW", self.hide)
 
-class OutputWindow(tk.Toplevel):
+    def show(self, task):
+        self.task = task
+        self.fill(task)
+        self.deiconify()
+        self.lift()
+        self.focus_set()
+
+    def hide(self):
+        self.task = None
+        self.withdraw()
+
+    def fill(self, task):
+        pass
+
+    def _current_task(self):
+        # 開いている間に消された・片付けられたタスク（同期中の他の端末など）なら None
+        task = self.task
+        if task is None or task not in self.task_app.tasks:
+            self.hide()
+            return None
+        return task
+
+
+class EditDialog(PooledDialog):
     def __init__(self, master, task_app):
+        super().__init__(master, task_app, "タスク編集")
+        self.name_entry = tk.Entry(self, width=40)
+        self.name_entry.pack()
+        self.detail_entry = tk.Entry(self, width=40)
+        self.detail_entry.pack()
+        self.date_entry = _date_entry(self)
+        self.date_entry.pack()
+        self.hour_var = tk.StringVar()
+        self.minute_var = tk.StringVar()
+        _time_picker(self, self.hour_var, self.minute_var).pack()
+        self.importance_entry = tk.Entry(self, width=10)
+        self.importance_entry.pack()
+        tk.Label(self, text="通知（期限の何分前か）").pack()
+        self.remind_entry = tk.Entry(self, width=10)
+        self.remind_entry.pack()
+        self._filled_due = None
+        tk.Button(self, text="保存", command=self._save).pack(pady=5)
+        tk.Button(self, text="完了にする", command=self._complete).pack(pady=5)
+
+    def fill(self, task):
+        # 期限は文字列の形式によらず due_ts から出す（DueDialog と同じ）。期限なしは今日の 12:00 を出しておく
+        if task.due_ts is not None:
+            due = datetime.datetime.fromtimestamp(task.due_ts)
+        else:
+            due = datetime.datetime.combine(datetime.date.today(), datetime.time(12, 0))
+        date, hour, minute = due.strftime("%Y-%m-%d"), due.strftime("%H"), due.strftime("%M")
+        self._filled_due = _format_due(date, hour, minute)  # 日時に触っていなければ期限は書き換えない
+        for entry, value in ((self.name_entry, task.name), (self.detail_entry, task.detail),
+                             (self.importance_entry, task.importance),
+                             (self.remind_entry, "" if task.remind_minutes is None else task.remind_minutes)):
+            entry.delete(0, tk.END)
+            entry.insert(0, str(value))
+        self.date_entry.set_date(date)
+        self.hour_var.set(hour)
+        self.minute_var.set(minute)
+
+    def _complete(self):
+        task = self._current_task()
+        if task:
+            self.task_app._complete_task(task)
+            self.hide()
+
+    def _save(self):
+        task = self._current_task()
+        if task is None:
+            return
+        try:
+            new_importance = validate_importance(self.importance_entry.get())
+            remind = recurrence.parse_remind(self.remind_entry.get())
+        except InvalidTask as e:
+            messagebox.showerror("エラー", str(e), parent=self)
+            return
+        fields = dict(name=self.name_entry.get(), detail=self.detail_entry.get(), importance=new_importance,
+                      remind_minutes=remind)
+        new_due = _format_due(self.date_entry.get(), self.hour_var.get(), self.minute_var.get())
+        if new_due != self._filled_due:
+            if fade.to_epoch(new_due) is None:
+                messagebox.showerror("エラー", "時刻が正しくありません", parent=self)
+                return
+            fields["due"] = new_due
+        self.task_app.update_task(task, **fields)
+        self.hide()
+
+
+class DueDialog(PooledDialog):
+    # 可視化画面の右クリック「新しい期限を選択」。その日の 12:00 にする
+    def __init__(self, master, task_app):
+        super().__init__(master, task_app, "期限を選択")
+        self.date_picker = _date_entry(self)
+        self.date_picker.pack(pady=10)
+        tk.Button(self, text="設定", command=self._apply).pack(pady=5)
+
+    def fill(self, task):
+        if task.due_ts is not None:
+            self.date_picker.set_date(datetime.date.fromtimestamp(task.due_ts))
+
+    def show(self, task):
+        super().show(task)
+        self.attributes("-topmost", True)  # 全画面の可視化画面の上に出す
+
+    def _apply(self):
+        task = self._current_task()
+        if task:
+            date_str = self.date_picker.get_date().strftime("%Y-%m-%d")
+            self.task_app.update_task(task, due=f"{date_str} 12:00:00")
+            self.hide()
+
+
+class OutputWindow(tk.Toplevel):
+    def __init__(self, master, task_app, backend="vector", summary=False):
         super().__init__(master)
         self.title("タスク可視化")
         self.attributes('-fullscreen', True)
@@ -428,145 +866,93 @@ class OutputWindow(tk.Toplevel):
         self.canvas = tk.Canvas(self, bg="#1e1e2f", highlightthickness=0)
         self.canvas.pack(fill="both", expand=True)
 
-        self.task_rects = {}
-        self.blinking_rects = {}
-        self.blink_state = True
         self.bind("<Escape>", lambda e: self.attributes("-fullscreen", False))
-        self.font_title = ("Times New Roman", 12, "bold")      # ✅ タイトル用フォント
-        self.font_detail = ("Times New Roman", 10, "normal")   # ✅ 詳細用フォント
-        self.text_color = "#f0f0f0"                             # ✅ 明るい文字色
 
-        self.render_tasks()
-        self.blink_overdue_rects()
+        # backend="raster" ならタイルを1枚の画像に塗る（大きな壁表示でアイテム数を抑える）
+        self.renderer = RENDERERS[backend](self.canvas, task_app, OUTPUT_STYLE,
+                                           width=self.winfo_screenwidth(), height=self.winfo_screenheight())
+        self.renderer.follow_resize()  # 全画面の解除・実際の画面の大きさに合わせて並べ直す
+        if task_app.search_matches is not None:
+            self.renderer.set_matches(task_app.search_matches)
+        # s でカテゴリごとの集計ブロックだけの表示と切り替え。ブロックはダブルクリックで展開
+        if summary:
+            self.renderer.set_summary(True)
+        self.bind("<KeyPress-s>", lambda e: self.renderer.set_summary(not self.renderer.summary_mode))
+        self.canvas.bind("<Double-Button-1>", self._on_left_double_click)
+        self.canvas.bind("<Double-Button-3>", self._on_right_double_click)
+
         self.protocol("WM_DELETE_WINDOW", self._on_close)
         self.canvas.bind("<Button-3>", self._on_right_click)
+        # F12 で計測のオーバーレイ（FPS・フレーム時間・アイテム数）
+        self.overlay = ProfilerOverlay(self.canvas)
+        self.bind("<F12>", self.overlay.toggle)
+        if task_app.profile_overlay:  # PROFILER.enabled は --profile-log でも立つので見ない
+            self.overlay.toggle()
 
 
-    def render_tasks(self):
-        self.canvas.delete("all")
-        self.task_rects.clear()
-        tasks = self.task_app.tasks
-        categories = self.task_app.categories
-        category_colors = self.task_app.category_colors
-
-        if not tasks:
-            return
-
-        tasks = sorted(tasks, key=lambda t: categories.index(t["category"]) if t["category"] in categories else len(categories))
-        total = sum(t["importance"] for t in tasks)
-        if total == 0:
-            return
-
-        width, height = 480, 300
-        x, y, row_height = 0, 0, 0
-
-        for task in tasks:
-            area_ratio = task["importance"] / total
-            area = width * height * area_ratio
-            w = max(int(area ** 0.5), 1)
-            h = max(int(area / w), 1)
-            if x + w > width:
-                x = 0
-                y += row_height
-                row_height = 0
-            base_color = category_colors.get(task["category"], "#cccccc")
-            fill_color = self.task_app._get_faded_color(base_color, task["created_at"], task["due"])
-            rect_id = self.canvas.create_rectangle(x, y, x + w, y + h, fill=fill_color, outline=base_color, width=4)
-            self.canvas.create_text(x + 4, y + 4, anchor="nw", text=task["name"],
-                        font=self.font_title, fill=self.text_color)
-            self.canvas.create_text(x + 4, y + 24, anchor="nw", text=task["detail"],
-                                    font=self.font_detail, fill=self.text_color)
-
-            self.task_rects[rect_id] = task
-            self.canvas.tag_bind(rect_id, "<Double-Button-1>", self._on_left_double_click)
-            self.canvas.tag_bind(rect_id, "<Double-Button-3>", self._on_right_double_click)
-            x += w
-            row_height = max(row_height, h)
-            try:
-                due_dt = datetime.datetime.fromisoformat(task["due"])
-                if due_dt < datetime.datetime.now():
-                    self.blinking_rects[rect_id] = True
-            except:
-                pass
-        if task["due"] != "none":
-            self.canvas.create_text(x + 4, y + 42, anchor="nw",
-                text=f"期限: {task['due']}", font=("Times New Roman", 9), fill="#cccccc")
-
-
-    def blink_overdue_rects(self):
-        for rect_id in list(self.blinking_rects.keys()):
-            try:
-                self.canvas.itemconfig(
-                    rect_id,
-                    fill="#ff0000" if self.blink_state else ""
-                )
-            except tk.TclError:
-                del self.blinking_rects[rect_id]
-        self.blink_state = not self.blink_state
-        self.after(500, self.blink_overdue_rects)
-
     def _on_left_double_click(self, event):
-        canvas_id = event.widget.find_closest(event.x, event.y)[0]
-        task = self.task_rects.get(canvas_id)
-        if task and messagebox.askyesno("削除確認", f"{task['name']} を削除しますか？"):
+        task = self.renderer.task_at(event.x, event.y)
+        if task is None:
+            cat = self.renderer.category_at(event.x, event.y)
+            if cat is not None and self.renderer.is_collapsed(cat):
+                self.renderer.toggle_category(cat)
+            return
+        if messagebox.askyesno("削除確認", f"{task.name} を削除しますか？"):
             self.task_app._delete_task(task)
-            self.render_tasks()
 
     def _on_right_double_click(self, event):
-        canvas_id = event.widget.find_closest(event.x, event.y)[0]
-        task = self.task_rects.get(canvas_id)
+        task = self.renderer.task_at(event.x, event.y)
         if task:
             self.task_app._open_edit_dialog(task)
-            self.render_tasks()
     def _on_right_click(self, event):
-        canvas_id = event.widget.find_closest(event.x, event.y)[0]
-        task = self.task_rects.get(canvas_id)
+        task = self.renderer.task_at(event.x, event.y)
         if not task:
             return
 
         menu = tk.Menu(self, tearoff=0)
         menu.add_command(label="状態をリセット", command=lambda: self._reset_task_timing(task))
-        menu.add_command(label="新しい期限を選択", command=lambda: self._choose_new_due(task))
+        menu.add_command(label="新しい期限を選択", command=lambda: self.task_app._open_due_dialog(task))
+        menu.add_command(label="完了にする", command=lambda: self.task_app._complete_task(task))
+        if self.renderer.summary_mode:
+            menu.add_command(label=f"{task.category} をまとめる",
+                             command=lambda: self.renderer.toggle_category(task.category))
         menu.tk_popup(event.x_root, event.y_root)
 
     def _on_close(self):
+        self.overlay.close()
+        self.renderer.close()
         self.task_app.output_window = None
         self.destroy()
     def _reset_task_timing(self, task):
-        now = datetime.datetime.now().isoformat()
-        task["created_at"] = now
-        task["due"] = (datetime.datetime.now() + datetime.timedelta(days=1)).isoformat()  # 仮の1日後
-        c = self.task_app.conn.cursor()
-        c.execute("UPDATE tasks SET created_at=?, due_date=? WHERE name=? AND created_at=?",
-                (now, task["due"], task["name"], task["created_at"]))
-        self.task_app.conn.commit()
-        self.task_app.render_tasks()
-        self.render_tasks()
-
-    def _choose_new_due(self, task):
-        def on_date_selected():
-            date_str = date_picker.get_date().strftime("%Y-%m-%d")
-            new_due = f"{date_str} 12:00:00"
-            task["due"] = new_due
-            c = self.task_app.conn.cursor()
-            c.execute("UPDATE tasks SET due_date=? WHERE name=? AND created_at=?",
-                    (new_due, task["name"], task["created_at"]))
-            self.task_app.conn.commit()
-            top.destroy()
-            self.task_app.render_tasks()
-            self.render_tasks()
-
-        top = tk.Toplevel(self)
-        top.title("期限を選択")
-        date_picker = DateEntry(top, width=20, date_pattern='yyyy-mm-dd')
-        date_picker.pack(pady=10)
-        tk.Button(top, text="設定", command=on_date_selected).pack(pady=5)
-
+        now = datetime.datetime.now()
+        due = (now + datetime.timedelta(days=1)).strftime(DUE_FORMAT)  # 仮の1日後。db.search が文字列で比べるので形式をそろえる
+        self.task_app.update_task(task, created_at=now.isoformat(), due=due)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--eager-load", action="store_true", help="起動時に全タスクを読み込んでから画面を出す")
+    parser.add_argument("--output-window", action="store_true",
+                        help="起動時に可視化画面も開く（指定しなければ「可視化画面を開く」ボタンで開く）")
+    parser.add_argument("--output-summary", action="store_true",
+                        help="可視化画面をカテゴリごとの集計ブロックで始める（画面上で s キーで切り替え）")
+    parser.add_argument("--output-backend", choices=sorted(RENDERERS), default="vector",
+                        help="出力ウィンドウの描き方。raster はタイルを1枚の画像に塗る")
+    parser.add_argument("--sync", metavar="HOST:PORT", help="同期サーバー（python sync.py）につないで表示・編集する")
+    parser.add_argument("--profile", action="store_true", help="起動時から計測し、可視化画面にオーバーレイを出す（F12 で切り替え）")
+    parser.add_argument("--profile-log", metavar="PATH", help="計測の集計を5秒ごとに JSONL で追記する")
+    args = parser.parse_args()
+
+    PROFILER.enabled = args.profile
+    _enable_dpi_awareness()
     root = tk.Tk()
-    app = TaskApp(root)
+    app = TaskApp(root, lazy_load=not args.eager_load, output_backend=args.output_backend, sync_address=args.sync,
+                  profile_log=args.profile_log, open_output=args.output_window, output_summary=args.output_summary,
+                  profile_overlay=args.profile)
     root.mainloop()
+    if app.persist:
+        app.persist.close()
+    if app.sync:
+        app.sync.close()
 
 
@@ -0,0 +1,119 @@
+import queue
+import sqlite3
+import threading
+import time
+import tkinter as tk
+
+import db
+from profiler import PROFILER
+
+_FLUSH = "flush"
+_STOP = "stop"
+ERROR_POLL_MS = 200   # 書き込みエラーを Tk 側で拾う間隔
+CLOSE_TIMEOUT = 10    # 秒。終了時に書き込みの完了をこれ以上は待たない
+
+
+class PersistenceWorker:
+    # 書き込み専用スレッド。GUI からは submit() で積むだけで、
+    # interval_ms ごとにまとめて1トランザクションで commit する
+    def __init__(self, path, widget, on_error, interval_ms=100):
+        self.path = path
+        self.widget = widget
+        self.on_error = on_error
+        self.interval = interval_ms / 1000
+        self._queue = queue.Queue()
+        self._errors = queue.Queue()  # 書き込みスレッドからは Tk を触らず、ここに積むだけ
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="persistence", daemon=True)
+        self._thread.start()
+        self._after_id = widget.after(ERROR_POLL_MS, self._poll_errors)
+
+    def submit(self, sql, params=()):
+        self._queue.put((sql, params, False))
+
+    def submit_many(self, sql, rows):
+        self._queue.put((sql, list(rows), True))
+
+    def flush(self, timeout=None):
+        # ここまでに積んだ書き込みが commit されるまで待つ
+        done = threading.Event()
+        self._queue.put((_FLUSH, done, None))
+        return done.wait(timeout)
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        # Tk のスレッドから呼ぶ。timeout 内に書き終われば True
+        if self._closed:
+            return True
+        self._closed = True
+        try:
+            self.widget.after_cancel(self._after_id)
+        except tk.TclError:
+            pass
+        done = threading.Event()
+        self._queue.put((_STOP, done, None))
+        finished = done.wait(timeout)
+        self._thread.join(0 if not finished else timeout)
+        try:
+            self._report_errors()
+        except tk.TclError:
+            pass  # Tk がもう終わっている
+        return finished
+
+    def _run(self):
+        conn = db.connect(self.path)
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while batch[-1][0] not in (_FLUSH, _STOP):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            writes = [item for item in batch if item[0] not in (_FLUSH, _STOP)]
+            if writes:
+                self._commit(conn, writes)
+            marker, done, _ = batch[-1]
+            if marker in (_FLUSH, _STOP):
+                done.set()
+            if marker == _STOP:
+                conn.close()
+                return
+
+    @PROFILER.profiled("db.commit")
+    def _commit(self, conn, writes):
+        try:
+            with conn:
+                for sql, params, many in writes:
+                    (conn.executemany if many else conn.execute)(sql, params)
+            return
+        except sqlite3.Error:
+            pass
+        # まとめて失敗したら1件ずつやり直し、失敗したものだけ報告する
+        for sql, params, many in writes:
+            try:
+                with conn:
+                    (conn.executemany if many else conn.execute)(sql, params)
+            except sqlite3.Error as e:
+                self._report(e)
+
+    def _report(self, error):
+        self._errors.put(error)
+
+    def _report_errors(self):
+        while True:
+            try:
+                error = self._errors.get_nowait()
+            except queue.Empty:
+                return
+            self.on_error(error)
+
+    def _poll_errors(self):
+        try:
+            self._report_errors()
+        finally:
+            if not self._closed:
+                self._after_id = self.widget.after(ERROR_POLL_MS, self._poll_errors)
@@ -0,0 +1,172 @@
+# 計測。after のコールバックや DB 呼び出しの時間と、キャンバスのアイテム操作の回数をリングバッファにためる。
+# 普段は enabled=False で、デコレータは1回の属性チェックだけになる
+#   python main.py --profile                 起動時から計測（F12 でオーバーレイ）
+#   python main.py --profile-log prof.jsonl  5秒ごとに集計を JSONL に追記
+import collections
+import functools
+import json
+import threading
+import time
+
+RING_SIZE = 4096        # 名前ごとに残す計測数
+DUMP_INTERVAL_MS = 5000
+OVERLAY_INTERVAL_MS = 500
+OVERLAY_TAG = "profiler"
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.samples = {}   # name -> deque[(終了時刻, 秒)]
+        self.frames = collections.deque(maxlen=RING_SIZE)  # Tk のコールバック1回 = 1フレーム（終了時刻, 秒）
+        self.counters = collections.Counter()
+        self._lock = threading.Lock()  # 書き込みスレッドからも記録するので
+        self._users = 0           # acquire() 中のオーバーレイ・ProfileLog の数
+        self._was_enabled = False  # 最初の acquire() の前の enabled（--profile ならそのまま True）
+
+    def acquire(self):
+        # 計測を使うものが開くときに呼ぶ。全部が release() したら元の enabled に戻す
+        if self._users == 0:
+            self._was_enabled = self.enabled
+        self._users += 1
+        self.enabled = True
+
+    def release(self):
+        self._users -= 1
+        if self._users == 0:
+            self.enabled = self._was_enabled
+
+    def record(self, name, start, end, frame=False):
+        with self._lock:
+            ring = self.samples.get(name)
+            if ring is None:
+                ring = self.samples[name] = collections.deque(maxlen=RING_SIZE)
+            ring.append((end, end - start))
+            if frame:
+                self.frames.append((end, end - start))
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def profiled(self, name, frame=False):
+        # after のコールバックや DB 呼び出しに付ける。frame=True は画面の更新1回として FPS に数える
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, start, time.perf_counter(), frame)
+            return wrapper
+        return decorate
+
+    def frame_count(self, since):
+        with self._lock:
+            return sum(1 for end, _ in self.frames if end > since)
+
+    def summary(self, since=None):
+        # {"timers": {name: {count, p50, p99, max（ミリ秒）}}, "fps": .., "frame": {p50, p99}, "counters": {..}}
+        now = time.perf_counter()
+        with self._lock:
+            timers = {}
+            for name, ring in self.samples.items():
+                values = [d for end, d in ring if since is None or end > since]
+                if values:
+                    timers[name] = {"count": len(values), "p50": _percentile(values, 0.5) * 1000,
+                                    "p99": _percentile(values, 0.99) * 1000, "max": max(values) * 1000}
+            frames = [(end, d) for end, d in self.frames if since is None or end > since]
+            counters = dict(self.counters)
+        durations = [d for _, d in frames]
+        return {"timers": timers, "counters": counters,
+                "fps": sum(1 for end, _ in frames if end > now - 1),
+                "frame": {"p50": _percentile(durations, 0.5) * 1000, "p99": _percentile(durations, 0.99) * 1000}}
+
+
+PROFILER = Profiler()
+
+
+class ProfilerOverlay:
+    # キャンバスの左上に FPS・フレーム時間・アイテム数を出す。toggle() で出し入れ
+    def __init__(self, canvas, profiler=PROFILER):
+        self.canvas = canvas
+        self.profiler = profiler
+        self.text = None
+        self._after_id = None
+        self._last = (time.perf_counter(), {})  # 前回の表示時刻とカウンタ
+
+    def toggle(self, event=None):
+        if self.text is None:
+            self.profiler.acquire()
+            self.text = self.canvas.create_text(8, 8, anchor="nw", font=("Courier", 10, "bold"), fill="#00ff00",
+                                                tags=(OVERLAY_TAG,))
+            self._refresh()
+        else:
+            self.close()
+
+    def close(self):
+        if self._after_id is not None:
+            self.canvas.after_cancel(self._after_id)
+            self._after_id = None
+        if self.text is not None:
+            self.canvas.delete(self.text)
+            self.text = None
+            self.profiler.release()  # ほかのオーバーレイや ProfileLog が使っていれば計測は続く
+
+    def _refresh(self):
+        now = time.perf_counter()
+        stats = self.profiler.summary(since=now - 5)
+        # アイテム操作は前回の表示からの増分を、その間のフレーム数で割って1フレームあたりにする
+        last_time, last_counters = self._last
+        frames = max(self.profiler.frame_count(last_time), 1)
+        counters = stats["counters"]
+        per_frame = {k: (counters.get(k, 0) - last_counters.get(k, 0)) / frames
+                     for k in ("canvas.created", "canvas.deleted", "canvas.configured")}
+        self._last = (now, counters)
+        lines = [f"FPS {stats['fps']:3d}  frame p50 {stats['frame']['p50']:6.2f}ms  p99 {stats['frame']['p99']:6.2f}ms",
+                 f"items {len(self.canvas.find_all()) - 1}  per frame: created {per_frame['canvas.created']:.1f}"
+                 f"  deleted {per_frame['canvas.deleted']:.1f}  configured {per_frame['canvas.configured']:.1f}"]
+        for name, t in sorted(stats["timers"].items()):
+            lines.append(f"{name:<18} n={t['count']:<5d} p50 {t['p50']:6.2f}ms  p99 {t['p99']:6.2f}ms")
+        self.canvas.itemconfig(self.text, text="\n".join(lines))
+        self.canvas.tag_raise(OVERLAY_TAG)
+        self._after_id = self.canvas.after(OVERLAY_INTERVAL_MS, self._refresh)
+
+
+class ProfileLog:
+    # DUMP_INTERVAL_MS ごとに、その間の集計を1行の JSON で追記する。カウンタはその間の増分
+    def __init__(self, path, widget, profiler=PROFILER):
+        self.path = path
+        self.widget = widget
+        self.profiler = profiler
+        profiler.acquire()
+        self._since = time.perf_counter()
+        self._counters = {}
+        self._after_id = widget.after(DUMP_INTERVAL_MS, self._dump)
+
+    def _dump(self, reschedule=True):
+        stats = self.profiler.summary(since=self._since)
+        self._since = time.perf_counter()
+        counters = stats["counters"]
+        stats["counters"] = {k: v - self._counters.get(k, 0) for k, v in counters.items()}
+        self._counters = counters
+        stats["time"] = time.time()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(stats, ensure_ascii=False) + "\n")
+        if reschedule:
+            self._after_id = self.widget.after(DUMP_INTERVAL_MS, self._dump)
+
+    def close(self):
+        self.widget.after_cancel(self._after_id)
+        self._dump(reschedule=False)
+        self.profiler.release()
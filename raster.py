@@ -0,0 +1,109 @@
+import tkinter as tk
+
+from profiler import PROFILER
+from renderer import TaskCanvasRenderer
+
+OUTLINE_WIDTH = 2  # ベクター版の width=4 の枠のうち、矩形の内側に見える分
+
+
+class RasterRect:
+    # 画像に塗った1枚の矩形の状態（ベクター版のキャンバスアイテムIDの代わり）
+    __slots__ = ("coords", "fill", "outline", "blinking")
+
+    def __init__(self, coords, fill, outline):
+        self.coords = coords
+        self.fill = fill
+        self.outline = outline
+        self.blinking = False
+
+
+class RasterTaskRenderer(TaskCanvasRenderer):
+    # 全画面の壁表示向け。タイルは1枚の PhotoImage に直接塗り、変わった矩形の範囲だけ put し直す。
+    # キャンバスのアイテムはその画像1つと文字だけになり、数千件でも Tk が抱える矩形アイテムは増えない
+    def __init__(self, canvas, task_app, style, width=480, height=300, metrics=None, image=None):
+        self.background = canvas.cget("bg")
+        # image はベンチマークで put を数える偽物に差し替える用
+        self.image = image or tk.PhotoImage(master=canvas, width=width, height=height)
+        self.image.put(self.background, to=(0, 0, width, height))
+        # 最初に作るので重なり順は一番下。文字アイテムはこの上に乗る
+        self.image_item = canvas.create_image(0, 0, anchor="nw", image=self.image)
+        self._blinking = set()
+        self._blink_fill = ""
+        super().__init__(canvas, task_app, style, width, height, metrics)
+
+    def relayout(self):
+        super().relayout()
+        # ツリーマップは画面全体を埋めるので消えた矩形の跡は上書きされる。全部なくなったときだけ消す
+        if not self.items and not self.more:
+            self._clear_image()
+
+    def resize(self, width, height):
+        if (width, height) == (self.width, self.height) or width <= 1 or height <= 1:
+            return
+        self.image.configure(width=width, height=height)
+        self.image.put(self.background, to=(0, 0, width, height))
+        super().resize(width, height)
+        # 画像ごと塗り直したので、位置の変わらなかった矩形も塗る
+        for item in self.items.values():
+            self._paint(item.rect)
+        for entry in self.more.values():
+            self._paint(entry[0])
+
+    def clear(self):
+        super().clear()
+        self._clear_image()
+
+    def close(self):
+        super().close()
+        try:
+            self.canvas.delete(self.image_item)
+        except tk.TclError:
+            pass  # ウィンドウごと閉じたあと
+
+    def set_blink(self, fill):
+        self._blink_fill = fill
+        for rect in self._blinking:
+            self._paint(rect)
+
+    def _clear_image(self):
+        self.image.put(self.background, to=(0, 0, self.width, self.height))
+
+    def _paint(self, rect):
+        x0, y0, x1, y1 = rect.coords
+        if x1 <= x0 or y1 <= y0:
+            return
+        fill = self._blink_fill if rect.blinking else rect.fill
+        self.image.put(rect.outline or self.background, to=(x0, y0, x1, y1))
+        w = OUTLINE_WIDTH
+        if x1 - x0 > 2 * w and y1 - y0 > 2 * w:
+            self.image.put(fill or self.background, to=(x0 + w, y0 + w, x1 - w, y1 - w))
+        PROFILER.count("raster.painted")
+
+    def _rect_create(self, coords, fill, outline, tag):
+        rect = RasterRect(coords, fill, outline)
+        self._paint(rect)
+        return rect
+
+    def _rect_move(self, rect, coords):
+        rect.coords = coords
+        self._paint(rect)
+
+    def _rect_config(self, rect, **options):
+        for name, value in options.items():
+            setattr(rect, name, value)
+        self._paint(rect)
+
+    def _rect_blink(self, rect, blinking, fill):
+        rect.blinking = blinking
+        if blinking:
+            self._blinking.add(rect)
+            self._blink_fill = fill
+        else:
+            self._blinking.discard(rect)
+        self._paint(rect)
+
+    def _rect_delete(self, rect):
+        self._blinking.discard(rect)
+
+
+RENDERERS = {"vector": TaskCanvasRenderer, "raster": RasterTaskRenderer}
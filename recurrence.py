@@ -0,0 +1,188 @@
+# 繰り返しタスクの規則。書き方は3通り
+#   daily 09:00                 毎日
+#   weekly mon,thu 18:30        曜日ごと（mon tue wed thu fri sat sun）
+#   cron 0 9 * * 1-5            cron と同じ「分 時 日 月 曜日」（曜日は 0 と 7 が日曜）
+# 回ごとのタスクは HORIZON 先の分までしか tasks に作らない（materialize）
+import datetime
+
+import db
+from store import InvalidTask
+
+HORIZON = datetime.timedelta(days=1)
+SEARCH_DAYS = 366 * 5  # 次の回をこの日数先まで探す（2/30 のような起こらない規則で止まらないように）
+WEEKDAYS = ["sun", "mon", "tue", "wed", "thu", "fri", "sat"]
+DUE_FORMAT = "%Y-%m-%d %H:%M:00"  # 画面から追加したタスクと同じ期限の形式
+RULE_HELP = "例: daily 09:00 / weekly mon,thu 18:30 / cron 0 9 * * 1-5"
+
+
+def _parse_field(text, lo, hi):
+    values = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/", 1)
+            step = int(step)
+        if part == "*":
+            start, end = lo, hi
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+        else:
+            start = end = int(part)
+        if step <= 0 or start < lo or end > hi or start > end:
+            raise ValueError(part)
+        values.update(range(start, end + 1, step))
+    return sorted(values)
+
+
+def _parse_time(text):
+    hour, minute = (int(v) for v in text.split(":"))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(text)
+    return str(minute), str(hour)
+
+
+class CronRule:
+    # daily / weekly もこの形に直して持つ
+    def __init__(self, minute, hour, day, month, weekday):
+        self.minutes = _parse_field(minute, 0, 59)
+        self.hours = _parse_field(hour, 0, 23)
+        self.days = set(_parse_field(day, 1, 31))
+        self.months = set(_parse_field(month, 1, 12))
+        self.weekdays = {w % 7 for w in _parse_field(weekday, 0, 7)}
+        # cron と同じく、日と曜日の両方を指定したらどちらかに合えばよい
+        self.any_day = day == "*"
+        self.any_weekday = weekday == "*"
+
+    def _day_matches(self, date):
+        if date.month not in self.months:
+            return False
+        day_ok = date.day in self.days
+        weekday_ok = (date.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, when):
+        # when より後で規則に合う最初の時刻（分単位）。なければ None
+        start = when.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        date = start.date()
+        for _ in range(SEARCH_DAYS):
+            if self._day_matches(date):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = datetime.datetime.combine(date, datetime.time(hour, minute))
+                        if candidate >= start:
+                            return candidate
+            date += datetime.timedelta(days=1)
+        return None
+
+
+def parse_rule(text):
+    words = text.split()
+    try:
+        if words and words[0] == "daily" and len(words) == 2:
+            return CronRule(*_parse_time(words[1]), "*", "*", "*")
+        if words and words[0] == "weekly" and len(words) == 3:
+            days = ",".join(str(WEEKDAYS.index(d)) for d in words[1].lower().split(","))
+            return CronRule(*_parse_time(words[2]), "*", "*", days)
+        if words and words[0] == "cron":
+            words = words[1:]
+        if len(words) == 5:
+            return CronRule(*words)
+    except ValueError:
+        pass
+    raise InvalidTask(f"繰り返しの書き方が正しくありません（{RULE_HELP}）")
+
+
+def parse_remind(value):
+    # 期限の何分前に知らせるか。空なら None（知らせない）
+    value = str(value or "").strip()
+    if not value:
+        return None
+    try:
+        minutes = int(value)
+    except ValueError:
+        minutes = -1
+    if minutes < 0:
+        raise InvalidTask("通知は期限の何分前かを0以上の整数で入力してください。")
+    return minutes
+
+
+class Recurrence:
+    __slots__ = ("id", "name", "detail", "category", "importance", "rule_text", "rule", "remind_minutes",
+                 "last_at", "next_at")
+
+    # 引数は db.RECURRENCE_COLUMNS の順
+    def __init__(self, id, name, detail, category, importance, rule, remind_minutes, last_at, next_at):
+        self.id = id
+        self.name = name
+        self.detail = detail
+        self.category = category
+        self.importance = importance
+        self.rule_text = rule
+        self.rule = parse_rule(rule)
+        self.remind_minutes = remind_minutes
+        self.last_at = last_at  # 最後に作った回の期限（ISO 形式）。次の回の created_at になる
+        self.next_at = next_at  # まだ作っていない次の回の期限。None なら終わり
+
+    def row(self):
+        return (self.id, self.name, self.detail, self.category, self.importance, self.rule_text,
+                self.remind_minutes, self.last_at, self.next_at)
+
+    def task_values(self, task_id, created_at, due):
+        # db.insert_occurrence_sql の引数
+        return (task_id, self.name, self.detail, self.category, due, self.importance, created_at,
+                self.remind_minutes, self.id)
+
+    def wake_time(self):
+        # 次に materialize すべき時刻
+        if self.next_at is None:
+            return None
+        return datetime.datetime.fromisoformat(self.next_at) - HORIZON
+
+    def materialize(self, now):
+        # now + HORIZON までの回を [(created_at, due)] で返し、last_at / next_at を進める。
+        # 閉じていた間に過ぎた回は作らない
+        occurrences = []
+        next_at = datetime.datetime.fromisoformat(self.next_at) if self.next_at else None
+        if next_at is not None and next_at < now:
+            next_at = self.rule.next_after(now)
+        while next_at is not None and next_at <= now + HORIZON:
+            due = next_at.strftime(DUE_FORMAT)
+            occurrences.append((self.last_at or now.isoformat(), due))
+            self.last_at = next_at.isoformat()
+            next_at = self.rule.next_after(next_at)
+        self.next_at = next_at.isoformat() if next_at else None
+        return occurrences
+
+
+def new_recurrence(id, name, detail, category, importance, rule, remind_minutes, now):
+    recurrence = Recurrence(id, name, detail, category, importance, rule, remind_minutes, None, None)
+    first = recurrence.rule.next_after(now)
+    if first is None:
+        raise InvalidTask("この繰り返しは次の回がありません。")
+    recurrence.next_at = first.isoformat()
+    return recurrence
+
+
+def materialize_all(conn, now=None):
+    # 同期サーバーなど、GUI を通さずに書くとき用。時刻が来た繰り返しの回を tasks に作り、作った件数を返す
+    now = now or datetime.datetime.now()
+    created = 0
+    with conn:
+        for row in db.recurrences(conn):
+            recurrence = Recurrence(*row)
+            wake = recurrence.wake_time()
+            if wake is None or wake > now:
+                continue
+            for created_at, due in recurrence.materialize(now):
+                created += conn.execute(db.insert_occurrence_sql(),
+                                        recurrence.task_values(None, created_at, due)).rowcount
+            conn.execute(db.save_recurrence_sql(), recurrence.row())
+    return created
+
+
+def next_wake(conn):
+    # 次に materialize_all を呼ぶべき時刻。繰り返しがなければ None
+    row = conn.execute("SELECT MIN(next_at) FROM recurrences WHERE next_at IS NOT NULL").fetchone()
+    return datetime.datetime.fromisoformat(row[0]) - HORIZON if row[0] else None
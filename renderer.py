@@ -0,0 +1,524 @@
+import functools
+import time
+import tkinter.font as tkfont
+
+from blink import BLINK_TAG
+from fade import OVERDUE, build_palette, fade_state
+from layout import TreemapLayout
+from profiler import PROFILER
+from scheduler import Scheduler
+from store import UPDATED
+
+TASK_TAG = "task"
+MORE_TAG = "more"
+SUMMARY_WAKE = "summary"  # _wakeups のキー（ほかはタスク ID）。まとめブロックの期限切れ・次の期限が変わる時刻
+TEXT_KEYS = ("name", "detail", "due")
+TEXT_PAD = 4
+MIN_TEXT_WIDTH = 24  # 文字を置ける幅がこれ未満のタイルには文字を出さない
+ELLIPSIS = "…"
+RESIZE_DEBOUNCE_MS = 150  # ウィンドウの端をドラッグしている間は並べ直さず、止まってから1回だけ
+FONT_SCALE_MIN = 0.75
+FONT_SCALE_MAX = 4
+BASE_DPI = 96
+
+# 行ごとの位置（タイル上端からの dy）・フォント・文字色。
+# dim は検索で外れたタイルの色、match は一致したタイルの枠の色。
+# size はこの文字の大きさで作ったときのキャンバスの大きさ（実際の大きさに合わせて scale_style で伸縮）
+APP_STYLE = {
+    "size": (480, 300),
+    "name": {"dy": 4, "font": ("Arial", 8, "bold"), "fill": "black"},
+    "detail": {"dy": 20, "font": ("Arial", 7), "fill": "gray20"},
+    "due": {"dy": 36, "font": ("Arial", 7), "fill": "gray40"},
+    "dim": {"fill": "#f2f2f2", "outline": "#e0e0e0"},
+    "match": {"outline": "#ff8c00"},
+}
+OUTPUT_STYLE = {
+    "size": (1920, 1080),
+    "name": {"dy": 4, "font": ("Times New Roman", 12, "bold"), "fill": "#f0f0f0"},      # ✅ タイトル用フォント
+    "detail": {"dy": 24, "font": ("Times New Roman", 10, "normal"), "fill": "#f0f0f0"},  # ✅ 詳細用フォント
+    "due": {"dy": 42, "font": ("Times New Roman", 9), "fill": "#cccccc"},
+    "dim": {"fill": "#26263a", "outline": "#2e2e44"},
+    "match": {"outline": "#ffd700"},
+}
+
+
+def scale_style(style, factor, font_factor=None):
+    # 行の位置（ピクセル）を factor 倍、フォント（ポイント）を font_factor 倍にした style を返す
+    font_factor = factor if font_factor is None else font_factor
+    scaled = dict(style)
+    for key in TEXT_KEYS:
+        line = dict(style[key])
+        family, size, *rest = line["font"]
+        line["font"] = (family, max(6, round(size * font_factor)), *rest)
+        line["dy"] = round(line["dy"] * factor)
+        scaled[key] = line
+    return scaled
+
+
+class FontMetrics:
+    # tkinter.font.Font はフォントごとに1回だけ作り、測った幅も覚えておく
+    CACHE_LIMIT = 20000
+
+    def __init__(self, root):
+        self.root = root
+        self._fonts = {}
+        self._linespace = {}
+        self._widths = {}
+        self._fits = {}
+
+    def _font(self, spec):
+        font = self._fonts.get(spec)
+        if font is None:
+            font = self._fonts[spec] = tkfont.Font(root=self.root, font=spec)
+        return font
+
+    def dpi_scale(self):
+        # 96dpi を 1 としたときの画面の倍率。ポイント指定のフォントは Tk がこの分だけ大きく描く
+        return self.root.winfo_fpixels("1i") / BASE_DPI
+
+    def linespace(self, spec):
+        value = self._linespace.get(spec)
+        if value is None:
+            value = self._linespace[spec] = self._font(spec).metrics("linespace")
+        return value
+
+    def measure(self, spec, text):
+        key = (spec, text)
+        value = self._widths.get(key)
+        if value is None:
+            if len(self._widths) > self.CACHE_LIMIT:
+                self._widths.clear()
+            value = self._widths[key] = self._font(spec).measure(text)
+        return value
+
+    def fit(self, spec, text, max_width):
+        # max_width に収まるよう末尾を「…」で切る
+        key = (spec, text, max_width)
+        value = self._fits.get(key)
+        if value is not None:
+            return value
+        if self.measure(spec, text) <= max_width:
+            value = text
+        else:
+            lo, hi = 0, len(text)
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if self.measure(spec, text[:mid] + ELLIPSIS) <= max_width:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            value = text[:lo] + ELLIPSIS if lo else ""
+        if len(self._fits) > self.CACHE_LIMIT:
+            self._fits.clear()
+        self._fits[key] = value
+        return value
+
+
+class TaskItem:
+    # 1タスク分のキャンバスアイテムと、最後に描いた状態
+    __slots__ = ("task", "rect", "texts", "coords", "fill", "outline", "next_ts", "overdue")
+
+    def __init__(self, task):
+        self.task = task
+        self.rect = None
+        self.texts = {}  # "name" / "detail" / "due" -> [text id, 表示中の文字列]
+        self.coords = None
+        self.fill = None
+        self.outline = None
+        self.next_ts = None
+        self.overdue = False
+
+
+class TaskCanvasRenderer:
+    # タスクIDごとにキャンバスアイテムを保持し、変化したものだけ coords / itemconfig する
+    def __init__(self, canvas, task_app, style, width=480, height=300, metrics=None):
+        self.canvas = canvas
+        self.task_app = task_app
+        self.base_style = style
+        self.width = width
+        self.height = height
+        self.metrics = metrics or FontMetrics(canvas)
+        self.style = self._scaled_style()
+        self.clock = time.time  # ベンチマークでは差し替える
+        self.layout = TreemapLayout()
+        self.items = {}           # task id -> TaskItem
+        self.more = {}            # category -> [rect, text id, coords, 表示中の文字列, 色]（小さいタスクのまとめ）
+        self.matches = None       # 検索に一致したタスクIDの集合。None なら検索していない
+        # summary_mode ではカテゴリごとに1ブロック（件数・重要度・期限切れ・次の期限）だけ描き、
+        # expanded のカテゴリだけタスクを並べる
+        self.summary_mode = False
+        self.expanded = set()
+        self._collapsed = set()   # 直近の relayout でまとめたカテゴリ
+        self._summary_ts = None   # まとめブロックの「期限切れ」「次の期限」が変わる時刻
+        self._needs_layout = False
+        self._touched = set()     # 並べ直し不要な変更があったタスクID
+        self._flush_id = None
+        # task id -> 色の段階か期限切れが変わる時刻。clock はベンチマークで差し替えるので毎回引く
+        self._wakeups = Scheduler(canvas, clock=lambda: self.clock(), name="render.wake")
+        self._resize_id = None
+        self._pending_size = None
+        task_app.blink.subscribe(self)
+        task_app.tasks.subscribe(self._on_event)
+        self.relayout()
+
+    def _on_event(self, event):
+        # TaskStore からの変更はためておき、1フレームに1回 _flush でまとめて反映する
+        if event.kind == UPDATED and "importance" not in event.fields:
+            self._touched.update(task.id for task in event.tasks)
+        else:
+            self._needs_layout = True
+        if self._flush_id is None:
+            self._flush_id = self.canvas.after_idle(self._flush)
+
+    @PROFILER.profiled("render.flush", frame=True)
+    def _flush(self):
+        self._flush_id = None
+        if self._needs_layout:
+            self.relayout()
+            return
+        now = self.clock()
+        for task_id in self._touched:
+            item = self.items.get(task_id)
+            if item is not None:
+                self._update_texts(item)
+                self._update_color(item, now)
+        self._touched.clear()
+        if self._collapsed:
+            self._update_more()  # まとめたカテゴリの期限が変わったかもしれない
+
+    @PROFILER.profiled("render.relayout")
+    def relayout(self):
+        # 並べ直しが要る変更のあとに呼ぶ（キャンバスには差分だけ反映）
+        self._needs_layout = False
+        self._touched.clear()
+        app = self.task_app
+        self._collapsed = set(app.tasks.groups) - self.expanded if self.summary_mode else set()
+        placed = self.layout.layout(app.tasks, app.categories, self.width, self.height, self._collapsed)
+        now = self.clock()
+        seen = set()
+        for task, coords in placed:
+            seen.add(task.id)
+            item = self.items.get(task.id)
+            if item is None:
+                item = self._create_item(task, coords)
+                self.items[task.id] = item
+            else:
+                item.task = task
+                self._update_geometry(item, coords)
+            self._update_texts(item)
+            self._update_color(item, now)
+        for task_id in [tid for tid in self.items if tid not in seen]:
+            self._remove_item(task_id)
+        self._update_more()
+
+    def task_at(self, x, y):
+        # クリック位置のタスク（文字の上でも下の矩形のタスクになる）。なければ None
+        hit = self.layout.hit_test(self.canvas.canvasx(x), self.canvas.canvasy(y))
+        return hit if not isinstance(hit, str) else None
+
+    def category_at(self, x, y):
+        # まとめブロック（summary_mode のカテゴリか「+N件」）ならそのカテゴリ名。なければ None
+        hit = self.layout.hit_test(self.canvas.canvasx(x), self.canvas.canvasy(y))
+        return hit if isinstance(hit, str) else None
+
+    def is_collapsed(self, category):
+        return category in self._collapsed
+
+    def set_summary(self, enabled):
+        self.summary_mode = enabled
+        self.expanded.clear()
+        self.relayout()
+
+    def toggle_category(self, category):
+        # summary_mode でカテゴリを展開する・まとめ直す
+        self.expanded ^= {category}
+        if self.summary_mode:
+            self.relayout()
+
+    def clear(self):
+        for task_id in list(self.items):
+            self._remove_item(task_id)
+        for cat in list(self.more):
+            self._remove_more(cat)
+        self._wakeups.clear()
+
+    def follow_resize(self):
+        # キャンバスの大きさが変わったら並べ直す（<Configure> は RESIZE_DEBOUNCE_MS 止まるまでためる）
+        self.canvas.bind("<Configure>", self._on_configure, add="+")
+
+    def _on_configure(self, event):
+        self._pending_size = (event.width, event.height)
+        if self._resize_id is not None:
+            self.canvas.after_cancel(self._resize_id)
+        self._resize_id = self.canvas.after(RESIZE_DEBOUNCE_MS, self._apply_resize)
+
+    @PROFILER.profiled("render.resize", frame=True)
+    def _apply_resize(self):
+        self._resize_id = None
+        self.resize(*self._pending_size)
+
+    def resize(self, width, height):
+        if (width, height) == (self.width, self.height) or width <= 1 or height <= 1:
+            return
+        self.width = width
+        self.height = height
+        style = self._scaled_style()
+        if style != self.style:
+            # 文字の大きさが変わったら文字アイテムは作り直す（relayout が新しい style で置く）
+            self.style = style
+            for item in self.items.values():
+                for text_id, _ in item.texts.values():
+                    self.canvas.delete(text_id)
+                item.texts.clear()
+            for cat in list(self.more):
+                self._remove_more(cat)
+        self.relayout()
+
+    def _scaled_style(self):
+        # キャンバスが style["size"] の何倍か。行の位置はその倍率、フォントは DPI の分を割り引いた倍率
+        # （ポイント指定のフォントは高 DPI では Tk が大きく描くので、文字がタイルに占める割合を保つ）
+        ref_width, ref_height = self.base_style["size"]
+        factor = min(self.width / ref_width, self.height / ref_height)
+        factor = round(min(max(factor, FONT_SCALE_MIN), FONT_SCALE_MAX) * 4) / 4  # 少しの伸縮では変えない
+        font_factor = factor / self.metrics.dpi_scale()
+        if factor == 1 and font_factor == 1:
+            return self.base_style
+        return scale_style(self.base_style, factor, font_factor)
+
+    def close(self):
+        if self._resize_id is not None:
+            self.canvas.after_cancel(self._resize_id)
+            self._resize_id = None
+        self._wakeups.clear()
+        if self._flush_id is not None:
+            self.canvas.after_cancel(self._flush_id)
+            self._flush_id = None
+        self.task_app.blink.unsubscribe(self)
+        self.task_app.blink.release(self)
+        self.task_app.tasks.unsubscribe(self._on_event)
+
+    @PROFILER.profiled("render.matches", frame=True)
+    def set_matches(self, matches):
+        # 検索結果を反映する。一致しないタイルは文字を消して dim の色で塗る（None で元に戻す）
+        self.matches = matches
+        now = self.clock()
+        for item in self.items.values():
+            self._update_texts(item)
+            self._update_color(item, now)
+        self._update_more()
+
+    def _dimmed(self, task):
+        return self.matches is not None and task.id not in self.matches
+
+    def set_blink(self, fill):
+        # BlinkService から呼ばれる。期限切れの矩形をまとめて塗り替える
+        self.canvas.itemconfig(BLINK_TAG, fill=fill)
+        PROFILER.count("canvas.configured")
+
+    # 矩形の描き方。RasterTaskRenderer はここを上書きして画像に塗る
+    def _rect_create(self, coords, fill, outline, tag):
+        PROFILER.count("canvas.created")
+        return self.canvas.create_rectangle(*coords, fill=fill, outline=outline, width=4, tags=(tag,))
+
+    def _rect_move(self, rect, coords):
+        self.canvas.coords(rect, *coords)
+        PROFILER.count("canvas.configured")
+
+    def _rect_config(self, rect, **options):
+        self.canvas.itemconfig(rect, **options)
+        PROFILER.count("canvas.configured")
+
+    def _rect_blink(self, rect, blinking, fill):
+        PROFILER.count("canvas.configured")
+        if blinking:
+            self.canvas.addtag_withtag(BLINK_TAG, rect)
+            self.canvas.itemconfig(rect, fill=fill)
+        else:
+            self.canvas.dtag(rect, BLINK_TAG)
+
+    def _rect_delete(self, rect):
+        self.canvas.delete(rect)
+        PROFILER.count("canvas.deleted")
+
+    def _wake(self, task_id):
+        # 色の段階か期限切れ状態が変わったタスクだけ塗り直す
+        item = self.items.get(task_id)
+        if item is not None:
+            item.next_ts = None
+            self._update_color(item, self.clock())
+
+    def _create_item(self, task, coords):
+        item = TaskItem(task)
+        item.rect = self._rect_create(coords, "", "", TASK_TAG)
+        item.coords = coords
+        return item
+
+    def _update_geometry(self, item, coords):
+        if coords == item.coords:
+            return
+        item.coords = coords
+        x0, y0 = coords[0], coords[1]
+        self._rect_move(item.rect, coords)
+        for key, (text_id, _) in item.texts.items():
+            self.canvas.coords(text_id, x0 + TEXT_PAD, y0 + self.style[key]["dy"])
+        PROFILER.count("canvas.configured", len(item.texts))
+
+    def _fit_texts(self, task, coords):
+        # タイルに収まる行だけを、幅に合わせて切り詰めて返す
+        x0, y0, x1, y1 = coords
+        width = x1 - x0 - 2 * TEXT_PAD
+        if width < MIN_TEXT_WIDTH or self._dimmed(task):
+            return {}
+        values = {"name": task.name, "detail": task.detail,
+                  "due": f"期限: {task.due}" if task.due != "none" else ""}
+        texts = {}
+        for key in TEXT_KEYS:
+            style = self.style[key]
+            if style["dy"] + self.metrics.linespace(style["font"]) > y1 - y0:
+                break  # これ以降の行は下にはみ出す
+            if values[key]:
+                text = self.metrics.fit(style["font"], values[key], width)
+                if text:
+                    texts[key] = text
+        return texts
+
+    def _update_texts(self, item):
+        wanted = self._fit_texts(item.task, item.coords)
+        x0, y0 = item.coords[0], item.coords[1]
+        for key in TEXT_KEYS:
+            current = item.texts.get(key)
+            text = wanted.get(key)
+            if text is None:
+                if current is not None:
+                    self.canvas.delete(current[0])
+                    del item.texts[key]
+                    PROFILER.count("canvas.deleted")
+            elif current is None:
+                style = self.style[key]
+                text_id = self.canvas.create_text(x0 + TEXT_PAD, y0 + style["dy"], anchor="nw", text=text,
+                                                  font=style["font"], fill=style["fill"])
+                item.texts[key] = [text_id, text]
+                PROFILER.count("canvas.created")
+            elif current[1] != text:
+                self.canvas.itemconfig(current[0], text=text)
+                current[1] = text
+                PROFILER.count("canvas.configured")
+
+    def _update_more(self):
+        # 「+N件」のまとめブロックと summary_mode のカテゴリのブロック。カテゴリにつき1つなので、
+        # タスクが何件あってもアイテム数は増えない
+        overflow = self.layout.overflow
+        for cat in [c for c in self.more if c not in overflow]:
+            self._remove_more(cat)
+        style = self.style["name"]
+        now = self.clock()
+        self._summary_ts = None
+        for cat, (coords, count) in overflow.items():
+            base_color = self.task_app.category_colors.get(cat, "#cccccc")
+            if cat in self._collapsed:
+                lines = self._summary_lines(cat, now)
+            else:
+                lines = [f"+{count}件"]
+            if self.matches is not None:
+                # まとめた中の一致数も出す。1件もなければ外れたタイルと同じ色に
+                hidden = self.task_app.tasks.positive(cat)[-count:] if count else []
+                found = sum(1 for t in hidden if t.id in self.matches)
+                lines[-1] += f"（一致 {found}）"
+                if not found:
+                    base_color = self.style["dim"]["fill"]
+            width = max(coords[2] - coords[0] - 2 * TEXT_PAD, 0)
+            label = "\n".join(self.metrics.fit(style["font"], line, width) for line in lines)
+            entry = self.more.get(cat)
+            if entry is None:
+                rect = self._rect_create(coords, base_color, base_color, MORE_TAG)
+                text = self.canvas.create_text(coords[0] + TEXT_PAD, coords[1] + style["dy"], anchor="nw",
+                                               text=label, font=style["font"], fill=style["fill"], tags=(MORE_TAG,))
+                self.more[cat] = [rect, text, coords, label, base_color]
+                continue
+            rect, text, old_coords, old_label, old_color = entry
+            if coords != old_coords:
+                self._rect_move(rect, coords)
+                self.canvas.coords(text, coords[0] + TEXT_PAD, coords[1] + style["dy"])
+                entry[2] = coords
+            if label != old_label:
+                self.canvas.itemconfig(text, text=label)
+                entry[3] = label
+            if base_color != old_color:
+                self._rect_config(rect, fill=base_color, outline=base_color)
+                entry[4] = base_color
+        if self._summary_ts is None:
+            self._wakeups.cancel(SUMMARY_WAKE)
+        else:
+            self._wakeups.schedule(SUMMARY_WAKE, self._summary_ts, self._update_more)
+
+    def _summary_lines(self, cat, now):
+        # TaskStore が持っている集計を読むだけ（タスクを数え直さない）
+        summary = self.task_app.tasks.summary(cat, now)
+        lines = [cat, f"{summary.count}件  重要度 {summary.importance}"]
+        if summary.overdue:
+            lines.append(f"期限切れ {summary.overdue}件")
+        if summary.next_due is not None:
+            lines.append("次の期限 " + time.strftime("%m/%d %H:%M", time.localtime(summary.next_due)))
+            if self._summary_ts is None or summary.next_due < self._summary_ts:
+                self._summary_ts = summary.next_due
+        return lines
+
+    def _remove_more(self, cat):
+        rect, text, _, _, _ = self.more.pop(cat)
+        self._rect_delete(rect)
+        self.canvas.delete(text)
+
+    def _update_color(self, item, now):
+        task = item.task
+        rect = item.rect
+        base_color = self.task_app.category_colors.get(task.category, "#cccccc")
+        dimmed = self._dimmed(task)
+        if dimmed:
+            outline = self.style["dim"]["outline"]
+        elif self.matches is not None:
+            outline = self.style["match"]["outline"]
+        else:
+            outline = base_color
+        if outline != item.outline:
+            self._rect_config(rect, outline=outline)
+            item.outline = outline
+
+        step, next_ts = fade_state(task.created_ts, task.due_ts, now)
+        if next_ts != item.next_ts:
+            item.next_ts = next_ts
+            if next_ts is not None:
+                self._wakeups.schedule(task.id, next_ts, functools.partial(self._wake, task.id))
+            else:
+                self._wakeups.cancel(task.id)
+
+        overdue = step == OVERDUE and not dimmed
+        if overdue != item.overdue:
+            # 期限切れの塗りは点滅側が持つ。戻ったときに塗り直せるよう fill を忘れておく
+            item.overdue = overdue
+            blink = self.task_app.blink
+            blink.set_overdue(self, task.id, overdue)
+            self._rect_blink(rect, overdue, blink.fill)
+            item.fill = None
+        if overdue:
+            return
+
+        if dimmed:
+            fill_color = self.style["dim"]["fill"]
+        elif step is None:
+            fill_color = base_color  # 期限なしの中間色（固定色）
+        else:
+            palette = self.task_app.category_palettes.get(task.category) or build_palette(base_color)
+            fill_color = palette[step]
+        if fill_color != item.fill:
+            self._rect_config(rect, fill=fill_color)
+            item.fill = fill_color
+
+    def _remove_item(self, task_id):
+        item = self.items.pop(task_id)
+        self._wakeups.cancel(task_id)
+        self._rect_delete(item.rect)
+        for text_id, _ in item.texts.values():
+            self.canvas.delete(text_id)
+        PROFILER.count("canvas.deleted", len(item.texts))
+        if item.overdue:
+            self.task_app.blink.set_overdue(self, task_id, False)
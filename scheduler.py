@@ -0,0 +1,93 @@
+import heapq
+import itertools
+import time
+import tkinter as tk
+
+from profiler import PROFILER
+
+MAX_SLEEP_MS = 60000  # 時計のずれに備えて、次の時刻が遠くてもこの間隔では起きる
+
+
+class Scheduler:
+    # key ごとに「この時刻に callback」を1つ持つ。ヒープの先頭にだけ after を張るので、
+    # 何万件登録しても次の時刻までは何も動かない。取り消しはヒープから取り出したときに捨てる。
+    # name を渡すと、1回の発火（時刻の来た callback 全部）を PROFILER に1フレームとして記録する
+    def __init__(self, widget, clock=time.time, name=None):
+        self.widget = widget
+        self.clock = clock
+        self.name = name
+        self._entries = {}  # key -> (時刻, 通し番号, callback)
+        self._heap = []     # (時刻, 通し番号, key)
+        self._seq = itertools.count()
+        self._after_id = None
+        self._after_ts = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, key, ts, callback):
+        seq = next(self._seq)
+        self._entries[key] = (ts, seq, callback)
+        heapq.heappush(self._heap, (ts, seq, key))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(ts, seq, key) for key, (ts, seq, _) in self._entries.items()]
+            heapq.heapify(self._heap)
+        self._arm()
+
+    def cancel(self, key):
+        if self._entries.pop(key, None) is not None and not self._entries:
+            self.clear()
+
+    def clear(self):
+        self._entries.clear()
+        self._heap.clear()
+        self._disarm()
+
+    def _valid(self, item):
+        ts, seq, key = item
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] == seq
+
+    def _arm(self):
+        while self._heap and not self._valid(self._heap[0]):
+            heapq.heappop(self._heap)
+        if not self._heap:
+            self._disarm()
+            return
+        ts = self._heap[0][0]
+        if self._after_id is not None and self._after_ts <= ts:
+            return
+        self._disarm()
+        delay = min(max(int((ts - self.clock()) * 1000) + 1, 1), MAX_SLEEP_MS)
+        self._after_ts = ts
+        self._after_id = self.widget.after(delay, self._fire)
+
+    def _disarm(self):
+        if self._after_id is not None:
+            try:
+                self.widget.after_cancel(self._after_id)
+            except tk.TclError:
+                pass
+            self._after_id = None
+            self._after_ts = None
+
+    def run_due(self):
+        # 時刻の来たものを今すぐ実行する（ベンチマークで時計を進めたとき）
+        self._disarm()
+        self._fire()
+
+    def _fire(self):
+        self._after_id = None
+        self._after_ts = None
+        start = time.perf_counter() if self.name and PROFILER.enabled else None
+        now = self.clock()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            item = heapq.heappop(self._heap)
+            if self._valid(item):
+                due.append(self._entries.pop(item[2])[2])
+        for callback in due:
+            callback()
+        if start is not None:
+            PROFILER.record(self.name, start, time.perf_counter(), frame=True)
+        self._arm()
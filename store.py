@@ -0,0 +1,247 @@
+import bisect
+import datetime
+import json
+from collections import namedtuple
+
+import fade
+
+# TaskStore が出す変更イベントの種類
+ADDED = "added"
+REMOVED = "removed"
+UPDATED = "updated"                    # 名前・詳細・期限・重要度など（fields に変わった項目名）
+CATEGORY_CHANGED = "category_changed"  # タスクのカテゴリが変わった
+CLEARED = "cleared"
+STYLE_CHANGED = "style_changed"        # カテゴリの一覧や色が変わった（タスクは変わらない）
+
+# tasks は変わったタスクのタプル。fields は UPDATED / CATEGORY_CHANGED のときだけ
+TaskEvent = namedtuple("TaskEvent", ["kind", "tasks", "fields"], defaults=((), ()))
+# TaskStore.summary の結果。importance は正の重要度の合計、next_due は次に来る期限（epoch 秒、なければ None）
+CategorySummary = namedtuple("CategorySummary", ["category", "count", "importance", "overdue", "next_due"])
+
+
+DUE_FORMAT = "%Y-%m-%d %H:%M:%S"  # tasks.due_date の形式（期限なしは "none"）
+CATEGORIES_PATH = "categories.json"
+DEFAULT_CATEGORIES = ["医学"]  # カテゴリ一覧がない・読めないとき
+
+
+class InvalidTask(ValueError):
+    pass
+
+
+def validate_task(name, importance, due="none"):
+    # 画面からの追加と一括インポートで同じ規則を使う。整えた (name, importance, due) を返し、だめなら InvalidTask
+    name = (name or "").strip()
+    if not name:
+        raise InvalidTask("タスク名は必須です。")
+    importance = validate_importance(importance)
+    return name, importance, normalize_due(due)
+
+
+def normalize_due(due):
+    # fromisoformat で読めるもの（日付だけ・T 区切り・タイムゾーンつき）を DUE_FORMAT にそろえる。
+    # 期限は文字列のまま範囲で比べる（db.search）ので、形式が混ざると並びが狂う
+    if due == "none":
+        return due
+    try:
+        value = datetime.datetime.fromisoformat(due)
+    except (TypeError, ValueError):
+        raise InvalidTask("期限は YYYY-MM-DD HH:MM:SS 形式か none で指定してください。") from None
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)  # ローカル時刻に直す
+    return value.strftime(DUE_FORMAT)
+
+
+def validate_importance(importance):
+    # 0 以下はレイアウトで面積がなくなり、画面から選べなくなるので編集でも弾く
+    try:
+        importance = int(str(importance).strip())
+    except ValueError:
+        importance = 0
+    if importance <= 0:
+        raise InvalidTask("重要度は1以上の整数で入力してください。")
+    return importance
+
+
+def load_categories(path=CATEGORIES_PATH):
+    # 画面（TaskApp）と bulk.py で共有する
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            categories = json.load(f)
+    except (OSError, ValueError):
+        return list(DEFAULT_CATEGORIES)
+    return categories or list(DEFAULT_CATEGORIES)
+
+
+def save_categories(categories, path=CATEGORIES_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(categories, f, ensure_ascii=False)
+
+
+class Task:
+    __slots__ = ("id", "name", "detail", "category", "due", "importance", "created_at", "remind_minutes",
+                 "created_ts", "due_ts")
+
+    def __init__(self, id, name, detail, category, due, importance, created_at, remind_minutes=None):
+        self.id = id
+        self.name = name
+        self.detail = detail
+        self.category = category
+        self.due = due
+        self.importance = importance
+        self.created_at = created_at
+        self.remind_minutes = remind_minutes  # 期限の何分前に知らせるか。None なら知らせない
+        fade.stamp(self)
+
+    def sort_key(self):
+        # カテゴリ内は重要度の大きい順（同じなら古い順）
+        return (-self.importance, self.id)
+
+
+class TaskStore:
+    # タスクをカテゴリごとに並べたまま持ち、重要度の合計も追加・削除・更新のたびに直す
+    def __init__(self, tasks=()):
+        self.by_id = {}
+        self.groups = {}    # category -> [Task]（sort_key 順）
+        self._keys = {}     # category -> [sort_key]（groups と同じ並び。bisect 用）
+        self.totals = {}    # category -> 正の重要度の合計
+        self._dues = {}     # category -> [(due_ts, id)]（期限のあるタスクだけ期限順。期限切れの数と次の期限用）
+        self.versions = {}  # category -> 中身が変わるたびに増える番号（レイアウトのキャッシュ用）
+        self._version = 0
+        self._listeners = []
+        self.load(tasks)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __iter__(self):
+        return iter(list(self.by_id.values()))
+
+    def __contains__(self, task):
+        return self.by_id.get(task.id) is task
+
+    def subscribe(self, listener):
+        # listener(event) が変更のたびに同期で呼ばれる。描画側はためておいて後でまとめて反映すること
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def emit(self, event):
+        for listener in list(self._listeners):
+            listener(event)
+
+    def get(self, task_id):
+        return self.by_id.get(task_id)
+
+    def total(self):
+        return sum(self.totals.values())
+
+    def positive(self, category):
+        # 重要度が正のタスク（レイアウトに載るもの）だけを返す
+        keys = self._keys.get(category, [])
+        return self.groups.get(category, [])[:bisect.bisect_left(keys, (0,))]
+
+    def load(self, tasks):
+        # まとめて入れるときは挿入ごとの bisect ではなく最後に1回ずつ並べ直す
+        touched = set()
+        tasks = tuple(tasks)
+        for task in tasks:
+            self.by_id[task.id] = task
+            self.groups.setdefault(task.category, []).append(task)
+            touched.add(task.category)
+        for cat in touched:
+            group = self.groups[cat]
+            group.sort(key=Task.sort_key)
+            self._keys[cat] = [t.sort_key() for t in group]
+            self.totals[cat] = sum(t.importance for t in group if t.importance > 0)
+            self._dues[cat] = sorted((t.due_ts, t.id) for t in group if t.due_ts is not None)
+            self._touch(cat)
+        if tasks:
+            self.emit(TaskEvent(ADDED, tasks))
+
+    def add(self, task):
+        self.by_id[task.id] = task
+        self._insert(task)
+        self.emit(TaskEvent(ADDED, (task,)))
+
+    def remove(self, task):
+        del self.by_id[task.id]
+        self._discard(task)
+        self.emit(TaskEvent(REMOVED, (task,)))
+
+    def summary(self, category, now):
+        # カテゴリの件数・重要度の合計・期限切れの数・次の期限。期限の索引を二分探索するだけなので O(log n)
+        dues = self._dues.get(category, ())
+        i = bisect.bisect_left(dues, (now,))
+        return CategorySummary(category, len(self.groups.get(category, ())), self.totals.get(category, 0), i,
+                               dues[i][0] if i < len(dues) else None)
+
+    def summaries(self, now):
+        return [self.summary(cat, now) for cat in self.groups]
+
+    def update(self, task, **fields):
+        regroup = "importance" in fields or "category" in fields
+        redue = "due" in fields and not regroup  # 並べ直すときは _discard / _insert が期限の索引も直す
+        if regroup:
+            self._discard(task)
+        elif redue:
+            self._drop_due(task)
+        for name, value in fields.items():
+            setattr(task, name, value)
+        if "created_at" in fields or "due" in fields:
+            fade.stamp(task)
+        if regroup:
+            self._insert(task)
+        elif redue:
+            self._add_due(task)
+        kind = CATEGORY_CHANGED if "category" in fields else UPDATED
+        self.emit(TaskEvent(kind, (task,), tuple(fields)))
+
+    def clear(self):
+        for cat in self.groups:
+            self._touch(cat)
+        self.by_id.clear()
+        self.groups.clear()
+        self._keys.clear()
+        self.totals.clear()
+        self._dues.clear()
+        self.emit(TaskEvent(CLEARED))
+
+    def _insert(self, task):
+        cat = task.category
+        keys = self._keys.setdefault(cat, [])
+        i = bisect.bisect_left(keys, task.sort_key())
+        keys.insert(i, task.sort_key())
+        self.groups.setdefault(cat, []).insert(i, task)
+        self.totals[cat] = self.totals.get(cat, 0) + max(task.importance, 0)
+        self._add_due(task)
+        self._touch(cat)
+
+    def _discard(self, task):
+        cat = task.category
+        keys = self._keys[cat]
+        i = bisect.bisect_left(keys, task.sort_key())
+        del keys[i]
+        del self.groups[cat][i]
+        self.totals[cat] -= max(task.importance, 0)
+        self._drop_due(task)
+        if not keys:
+            del self._keys[cat]
+            del self.groups[cat]
+            del self.totals[cat]
+            self._dues.pop(cat, None)
+        self._touch(cat)
+
+    def _add_due(self, task):
+        if task.due_ts is not None:
+            bisect.insort(self._dues.setdefault(task.category, []), (task.due_ts, task.id))
+
+    def _drop_due(self, task):
+        if task.due_ts is not None:
+            dues = self._dues[task.category]
+            del dues[bisect.bisect_left(dues, (task.due_ts, task.id))]
+
+    def _touch(self, cat):
+        self._version += 1
+        self.versions[cat] = self._version
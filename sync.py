@@ -0,0 +1,370 @@
+# 複数台で同じボードを見るための同期。サーバーだけが tasks.db を持ち、changelog（db のマイグレーション6）の
+# 版番号つき差分を接続中のクライアントに流す。やりとりは1行1つの JSON
+#   python sync.py --host 0.0.0.0                    サーバー（LAN に出すとき。既定は 127.0.0.1）
+#   python main.py --sync 192.168.0.10:8765           クライアント
+#
+# クライアント -> サーバー
+#   {"type": "hello", "since": 版}                      接続直後。since より後の差分から送られる（0 なら全件）
+#   {"type": "add", "task": {...}} / {"type": "update", "id": .., "fields": {...}} / {"type": "delete", "id": ..}
+#   {"type": "status", "ids": [..], "status": ..} / {"type": "clear"}
+#   {"type": "add_recurrence", "recurrence": {...}} / {"type": "delete_recurrence", "id": ..}
+#   {"type": "query", "request": n, "name": "search" など, "args": {...}}
+# サーバー -> クライアント
+#   {"type": "snapshot", "version": 版, "tasks": [行]}   遅れすぎたとき・初回
+#   {"type": "changes", "version": 版, "changes": [[版, op, task id, 行 or null]]}
+#   {"type": "result", "request": n, "value": ..} / {"type": "error", "message": ..}
+import argparse
+import asyncio
+import datetime
+import json
+import queue
+import threading
+import tkinter as tk
+import traceback
+
+import db
+import recurrence
+from profiler import PROFILER
+from store import InvalidTask, Task, normalize_due, validate_importance, validate_task
+
+DEFAULT_PORT = 8765
+POLL_INTERVAL = 0.2       # 秒。bulk.py など別のプロセスが書いた変更も changelog から拾う
+EXPIRE_INTERVAL = 60 * 60  # 秒。期限切れの古いタスクを片付ける間隔
+RECUR_MAX_SLEEP = 60       # 秒。繰り返しの次の回を作る時刻まで寝るが、時計のずれに備えてこれより長くは寝ない
+CHANGES_PER_MESSAGE = 5000
+RECEIVE_POLL_MS = 30      # クライアントが受信キューを見る間隔（Tk 側）
+RECONNECT_DELAY = 2       # 秒
+LINE_LIMIT = 256 * 1024 * 1024  # スナップショットは1行で送るので大きめに
+
+QUERIES = {"search": db.search, "history": db.history, "history_by_month": db.history_by_month,
+           "recurrences": db.recurrences}
+TASK_FIELDS = Task.__slots__[1:8]  # name .. remind_minutes（TASK_COLUMNS の id 以外と同じ順）
+
+
+def encode(message):
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def apply_changes(store, changes):
+    # 同じタスクへの変更は最後のものだけ見ればよい（upsert は行全体を持っている）。
+    # 新しいタスクは最後に TaskStore.load でまとめて入れる
+    latest = {}
+    for _, op, task_id, row in changes:
+        latest[task_id] = (op, row)
+    added = []
+    for task_id, (op, row) in latest.items():
+        task = store.get(task_id)
+        if op == "delete":
+            if task is not None:
+                store.remove(task)
+        elif task is None:
+            added.append(Task(*row))
+        else:
+            fields = {name: value for name, value in zip(TASK_FIELDS, row[1:]) if getattr(task, name) != value}
+            if fields:
+                store.update(task, **fields)
+    store.load(added)
+
+
+def apply_snapshot(store, rows):
+    store.clear()
+    store.load(Task(*row) for row in rows)
+
+
+class _Client:
+    def __init__(self, writer, since):
+        self.writer = writer
+        self.cursor = since
+        self.lock = asyncio.Lock()
+
+
+class SyncServer:
+    def __init__(self, path=db.DB_PATH):
+        self.conn = db.connect(path)
+        db.migrate(self.conn)
+        db.expire_overdue(self.conn)
+        db.prune_changelog(self.conn)
+        recurrence.materialize_all(self.conn)
+        self.version = db.changelog_version(self.conn)
+        self.clients = set()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self._handle, host, port, limit=LINE_LIMIT)
+        print(f"同期サーバー {host}:{port}（版 {self.version}）")
+        asyncio.create_task(self._poll())
+        asyncio.create_task(self._expire())
+        asyncio.create_task(self._recur())
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        client = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message.get("type") == "hello":
+                    since = int(message.get("since") or 0)
+                    self.version = db.changelog_version(self.conn)
+                    client = _Client(writer, since)
+                    self.clients.add(client)
+                    await self._push(client, snapshot=since == 0 or since > self.version)
+                elif client is not None:
+                    await self._handle_message(client, message)
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.close()
+
+    async def _handle_message(self, client, message):
+        kind = message.get("type")
+        if kind == "query":
+            try:
+                value = QUERIES[message["name"]](self.conn, **message.get("args", {}))
+                value = list(value) if isinstance(value, set) else [list(row) for row in value]
+                reply = {"type": "result", "request": message.get("request"), "value": value}
+            except (KeyError, TypeError, db.sqlite3.Error) as e:
+                reply = {"type": "error", "message": f"検索に失敗しました：{e}"}
+            client.writer.write(encode(reply))
+            await client.writer.drain()
+            return
+        try:
+            self._write(kind, message)
+        except (KeyError, TypeError, InvalidTask, db.sqlite3.Error) as e:
+            client.writer.write(encode({"type": "error", "message": str(e)}))
+            await client.writer.drain()
+            return
+        await self._broadcast()
+
+    def _write(self, kind, message):
+        # クライアントからの書き込み。changelog はトリガーが書くので、ここは tasks を変えるだけ
+        with self.conn:
+            if kind == "add":
+                task = message["task"]
+                due = task.get("due") or "none"
+                name, importance, due = validate_task(task.get("name"), task.get("importance"), due)
+                remind = recurrence.parse_remind(task.get("remind_minutes"))
+                self.conn.execute(db.insert_sql(), (name, task.get("detail", ""), task["category"], due, importance,
+                                                    task["created_at"], remind))
+            elif kind == "update":
+                fields = dict(message["fields"])
+                if "importance" in fields:
+                    fields["importance"] = validate_importance(fields["importance"])
+                if "due" in fields:
+                    fields["due"] = normalize_due(fields["due"])
+                self.conn.execute(*db.update_sql(message["id"], fields))
+            elif kind == "delete":
+                self.conn.execute("DELETE FROM tasks WHERE id=?", (message["id"],))
+            elif kind == "status":
+                ids = message["ids"]
+                self.conn.execute(db.set_status_sql(ids), (message["status"], *ids))
+            elif kind == "clear":
+                self.conn.execute("DELETE FROM tasks")
+            elif kind == "add_recurrence":
+                rec = message["recurrence"]
+                name, importance, _ = validate_task(rec.get("name"), rec.get("importance"))
+                new = recurrence.new_recurrence(None, name, rec.get("detail", ""), rec["category"], importance,
+                                                rec["rule"], recurrence.parse_remind(rec.get("remind_minutes")),
+                                                datetime.datetime.now())
+                self.conn.execute(db.save_recurrence_sql(), new.row())
+            elif kind == "delete_recurrence":
+                # もう作った回のタスクはそのまま残る
+                self.conn.execute("DELETE FROM recurrences WHERE id=?", (message["id"],))
+            else:
+                raise KeyError(kind)
+        if kind == "add_recurrence":
+            recurrence.materialize_all(self.conn)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            await self._broadcast()
+
+    async def _expire(self):
+        while True:
+            await asyncio.sleep(EXPIRE_INTERVAL)
+            db.expire_overdue(self.conn)
+            db.prune_changelog(self.conn)
+            await self._broadcast()
+
+    async def _recur(self):
+        # 繰り返しの回は次に作る時刻まで寝て、来たら作る
+        while True:
+            wake = recurrence.next_wake(self.conn)
+            delay = RECUR_MAX_SLEEP
+            if wake is not None:
+                delay = min(max((wake - datetime.datetime.now()).total_seconds(), 0), RECUR_MAX_SLEEP)
+            await asyncio.sleep(delay)
+            if recurrence.materialize_all(self.conn):
+                await self._broadcast()
+
+    async def _broadcast(self):
+        self.version = db.changelog_version(self.conn)
+        for client in list(self.clients):
+            if client.cursor < self.version:
+                try:
+                    await self._push(client)
+                except ConnectionError:
+                    self.clients.discard(client)
+
+    async def _push(self, client, snapshot=False):
+        # client.cursor より後の版を送る。changelog が消されていて続きが出せないときは全件
+        async with client.lock:
+            oldest = db.changelog_oldest(self.conn)
+            if not snapshot and client.cursor < (oldest - 1 if oldest is not None else self.version):
+                snapshot = True
+            if snapshot:
+                self.conn.execute("BEGIN")
+                version = db.changelog_version(self.conn)
+                rows = db.active_tasks(self.conn).fetchall()
+                self.conn.execute("COMMIT")
+                client.writer.write(encode({"type": "snapshot", "version": version, "tasks": rows}))
+                client.cursor = version
+                await client.writer.drain()
+            while True:
+                rows = db.changes_since(self.conn, client.cursor, CHANGES_PER_MESSAGE)
+                if not rows:
+                    break
+                changes = [[v, op, task_id, json.loads(data) if data else None] for v, op, task_id, data in rows]
+                client.cursor = rows[-1][0]
+                client.writer.write(encode({"type": "changes", "version": client.cursor, "changes": changes}))
+                await client.writer.drain()
+
+
+class SyncClient:
+    # main.py から使うクライアント。通信は別スレッドの asyncio で行い、受け取ったものは
+    # Tk のスレッドで on_snapshot(rows) / on_changes(changes) として渡す
+    def __init__(self, host, port, widget, on_snapshot, on_changes, on_error):
+        self.host = host
+        self.port = port
+        self.widget = widget
+        self.on_snapshot = on_snapshot
+        self.on_changes = on_changes
+        self.on_error = on_error
+        self.cursor = 0            # 受け取った最後の版。つなぎ直したらここから
+        self.connected = False
+        self._inbox = queue.Queue()
+        self._outbox = []          # つながっていない間に送ろうとしたもの
+        self._writer = None
+        self._requests = {}        # request 番号 -> callback
+        self._next_request = 1
+        self._closed = False
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="sync", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+        self._after_id = widget.after(RECEIVE_POLL_MS, self._receive)
+
+    def send(self, kind, **payload):
+        self._loop.call_soon_threadsafe(self._write, dict(payload, type=kind))
+
+    def request(self, name, args, callback):
+        # サーバーの db.search などを呼ぶ。結果は Tk のスレッドで callback(value)
+        request = self._next_request
+        self._next_request += 1
+        self._requests[request] = callback
+        self.send("query", request=request, name=name, args=args)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.widget.after_cancel(self._after_id)
+        except tk.TclError:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(1)
+
+    def _write(self, message):
+        if self._writer is None:
+            self._outbox.append(message)
+        else:
+            self._writer.write(encode(message))
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port, limit=LINE_LIMIT)
+            except OSError:
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            writer.write(encode({"type": "hello", "since": self.cursor}))
+            self._writer = writer
+            for message in self._outbox:
+                writer.write(encode(message))
+            self._outbox.clear()
+            self._inbox.put({"type": "connected"})
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    message = json.loads(line)
+                    if "version" in message:
+                        self.cursor = message["version"]
+                    self._inbox.put(message)
+            except (ConnectionError, ValueError):
+                pass
+            self._writer = None
+            writer.close()
+            self._inbox.put({"type": "disconnected"})
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    @PROFILER.profiled("sync.receive", frame=True)
+    def _receive(self):
+        # 1回に全部処理する。差分はまとめて TaskStore に入り、描画は renderer が1フレームにまとめる
+        try:
+            while True:
+                try:
+                    message = self._inbox.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    self._dispatch(message)
+                except Exception:
+                    traceback.print_exc()  # 1件の処理で落ちても残りと次のポーリングは続ける
+        finally:
+            if not self._closed:
+                self._after_id = self.widget.after(RECEIVE_POLL_MS, self._receive)
+
+    def _dispatch(self, message):
+        kind = message["type"]
+        if kind == "snapshot":
+            self.on_snapshot(message["tasks"])
+        elif kind == "changes":
+            self.on_changes(message["changes"])
+        elif kind == "result":
+            callback = self._requests.pop(message["request"], None)
+            if callback is not None:
+                callback(message["value"])
+        elif kind == "error":
+            self.on_error(message["message"])
+        elif kind in ("connected", "disconnected"):
+            self.connected = kind == "connected"
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    if not host:
+        return address, DEFAULT_PORT
+    return host, int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tasks.db を持ち、変更を各クライアントに流す同期サーバー")
+    parser.add_argument("--db", default=db.DB_PATH)
+    parser.add_argument("--host", default="127.0.0.1", help="LAN の他の端末からつなぐなら 0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(SyncServer(args.db).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()